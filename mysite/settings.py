@@ -61,6 +61,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "showup.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django_session_timeout.middleware.SessionTimeoutMiddleware",
@@ -72,6 +73,10 @@ MIDDLEWARE = [
     "whitenoise.middleware.WhiteNoiseMiddleware",
 ]
 
+# Set SHOWUP_PROFILING=1 to time every view and its SQL. The numbers are sent
+# back in a Server-Timing header and collected at /profiling for staff.
+SHOWUP_PROFILING = get_env_variable("SHOWUP_PROFILING") == "1"
+
 ROOT_URLCONF = "mysite.urls"
 
 TEMPLATES = [
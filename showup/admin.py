@@ -1,5 +1,14 @@
 from .forms import CustomUserForm
-from .models import Concert, CustomUser, Genre, Request, Squad, Swipe
+from .models import (
+    Concert,
+    CustomUser,
+    Genre,
+    Match,
+    Request,
+    Squad,
+    Swipe,
+    SyncCheckpoint,
+)
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
@@ -44,6 +53,13 @@ class GenreAdmin(admin.ModelAdmin):
         model = Genre
 
 
+class MatchAdmin(admin.ModelAdmin):
+    list_display = ["squad_1", "squad_2", "event"]
+
+    class Meta:
+        model = Match
+
+
 class RequestAdmin(admin.ModelAdmin):
     list_display = ["requester", "requestee"]
 
@@ -76,9 +92,18 @@ class SwipeAdmin(admin.ModelAdmin):
         model = Swipe
 
 
+class SyncCheckpointAdmin(admin.ModelAdmin):
+    list_display = ["borough", "synced_at", "inserted", "updated", "unchanged"]
+
+    class Meta:
+        model = SyncCheckpoint
+
+
 admin.site.register(Concert, ConcertAdmin)
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Genre, GenreAdmin)
+admin.site.register(Match, MatchAdmin)
 admin.site.register(Request, RequestAdmin)
 admin.site.register(Squad, SquadAdmin)
 admin.site.register(Swipe, SwipeAdmin)
+admin.site.register(SyncCheckpoint, SyncCheckpointAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ShowUpConfig(AppConfig):
     name = "showup"
+
+    def ready(self):
+        from . import signals  # noqa: F401
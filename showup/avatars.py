@@ -0,0 +1,72 @@
+from avatar.conf import settings
+from avatar.models import Avatar
+from avatar.utils import cached_funcs, get_cache_key, invalidate_cache
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+
+# The django-avatar tags we fill the cache of.
+PREFIXES = ("avatar", "avatar_url")
+
+PRIMARY_PROVIDER = "avatar.providers.PrimaryAvatarProvider"
+
+
+def prime_avatars(users, size=settings.AVATAR_DEFAULT_SIZE):
+    # Caches the {% avatar %} and {% avatar_url %} of every user in `users`
+    # that isn't cached yet, with one query for all their avatars. The tags
+    # then render from the cache, instead of querying once per face.
+    if not settings.AVATAR_CACHE_ENABLED:
+        return
+    users = {user.id: user for user in users}
+    keys = {get_cache_key(user, size, "avatar"): user for user in users.values()}
+    cached = cache.get_many(keys)
+    missing = [user for key, user in keys.items() if key not in cached]
+    if not missing:
+        return
+
+    # The primary avatar, or the latest one, like get_primary_avatar.
+    avatars = {}
+    for avatar in Avatar.objects.filter(user__in=missing).order_by(
+        "user_id", "-primary", "-date_uploaded"
+    ):
+        avatar.user = users[avatar.user_id]
+        avatars.setdefault(avatar.user_id, avatar)
+
+    entries = {}
+    for user in missing:
+        url = avatar_url(user, avatars.get(user.id), size)
+        html = render_to_string(
+            "avatar/avatar_tag.html",
+            {"user": user, "url": url, "size": size, "kwargs": {"alt": str(user)}},
+        )
+        entries[get_cache_key(user, size, "avatar")] = html
+        entries[get_cache_key(user, size, "avatar_url")] = url
+    cache.set_many(entries, settings.AVATAR_CACHE_TIMEOUT)
+
+    # django-avatar only invalidates the tags it has seen in this process.
+    cached_funcs.update(PREFIXES)
+
+
+def avatar_url(user, avatar, size):
+    # What the providers would give, with the avatar already loaded.
+    for path in settings.AVATAR_PROVIDERS:
+        if path == PRIMARY_PROVIDER:
+            if avatar is None:
+                continue
+            # Thumbnails of these sizes are made on upload, so don't ask the
+            # storage whether they exist.
+            if size not in settings.AVATAR_AUTO_GENERATE_SIZES:
+                if not avatar.thumbnail_exists(size):
+                    avatar.create_thumbnail(size)
+            url = avatar.avatar_url(size)
+        else:
+            url = import_string(path).get_avatar_url(user, size)
+        if url:
+            return url
+
+
+def invalidate_avatars(user):
+    # Forgets the cached tags of `user`, even if this process never rendered
+    # them.
+    cached_funcs.update(PREFIXES)
+    invalidate_cache(user)
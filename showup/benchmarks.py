@@ -0,0 +1,183 @@
+# Benchmarks for the views users hit the most. They aren't picked up by
+# `manage.py test`. Run them with:
+#
+#     python manage.py test showup.benchmarks
+#
+# Every view is measured on a seeded load dataset (see generate_load_data)
+# with the test client, so nothing goes over the network. The results are
+# written to BENCHMARK_RESULTS as JSON, and a view fails when it needs more
+# queries than the baseline in showup/benchmark_baseline.json, or when its
+# median gets slower than the baseline's by more than BENCHMARK_TOLERANCE.
+# Run with BENCHMARK_UPDATE=1 to write the results as the new baseline.
+
+import json
+import os
+import time
+
+from .models import Concert, CustomUser, Request, Squad, Swipe
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from io import StringIO
+
+BASELINE = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+RESULTS = os.environ.get("BENCHMARK_RESULTS", "benchmark_results.json")
+UPDATE = os.environ.get("BENCHMARK_UPDATE") == "1"
+
+# How much slower than the baseline a median may get, as a fraction. Timings
+# depend on the machine, so this is loose. Query counts don't, so those have
+# to match exactly.
+TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", "1.0"))
+
+# How many times each view is requested, after one warm-up request.
+REPEAT = int(os.environ.get("BENCHMARK_REPEAT", "20"))
+
+# The size of the dataset.
+DATASET = {
+    "users": int(os.environ.get("BENCHMARK_USERS", "20000")),
+    "concerts": int(os.environ.get("BENCHMARK_CONCERTS", "2000")),
+    "genres": 100,
+    "swipes": int(os.environ.get("BENCHMARK_SWIPES", "200000")),
+    "seed": 0,
+}
+
+
+def percentile(durations, p):
+    # Nearest-rank percentile of a sorted list.
+    return durations[min(len(durations) - 1, int(len(durations) * p / 100))]
+
+
+class ViewBenchmarks(TestCase):
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command("generate_load_data", stdout=StringIO(), **DATASET)
+
+        # Benchmark as a member of a squad going to the most popular event,
+        # since that's where the stacks and the swipes are.
+        cls.event = (
+            Concert.objects.annotate(squads=Count("interested"))
+            .order_by("-squads", "id")
+            .first()
+        )
+        cls.squad = cls.event.interested.order_by("id").first()
+        cls.user = CustomUser.objects.filter(squad=cls.squad).order_by("id").first()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with open(RESULTS, "w") as f:
+            json.dump(cls.results, f, indent=2, sort_keys=True)
+        if UPDATE:
+            with open(BASELINE, "w") as f:
+                json.dump(cls.results, f, indent=2, sort_keys=True)
+                f.write("\n")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def measure(self, name, requests):
+        # `requests` makes the requests; the first one only warms up.
+        durations, queries = [], []
+        for i, request in enumerate(requests):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request()
+                duration = (time.perf_counter() - start) * 1000
+            self.assertLess(response.status_code, 400)
+            if i:
+                durations.append(duration)
+                queries.append(len(captured))
+
+        durations.sort()
+        result = {
+            "requests": len(durations),
+            "p50_ms": round(percentile(durations, 50), 3),
+            "p95_ms": round(percentile(durations, 95), 3),
+            "max_ms": round(durations[-1], 3),
+            "queries": max(queries),
+        }
+        self.results[name] = result
+
+        baseline = {}
+        if os.path.exists(BASELINE) and not UPDATE:
+            with open(BASELINE) as f:
+                baseline = json.load(f).get(name, {})
+        if baseline:
+            self.assertLessEqual(result["queries"], baseline["queries"], name)
+            self.assertLessEqual(
+                result["p50_ms"], baseline["p50_ms"] * (1 + TOLERANCE), name
+            )
+
+    def get(self, url):
+        return [lambda: self.client.get(url)] * (REPEAT + 1)
+
+    def test_home(self):
+        self.measure("home", self.get(reverse("home")))
+
+    def test_events(self):
+        self.measure("events", self.get(reverse("events")))
+
+    def test_events_search(self):
+        self.measure("events_search", self.get(reverse("events") + "?search=venue"))
+
+    def test_event_stack(self):
+        self.measure(
+            "event_stack", self.get(reverse("event_stack", args=(self.event.id,)))
+        )
+
+    def test_swipe(self):
+        # Swipe on a different squad every time, as the stack would.
+        swiped = Swipe.objects.filter(swiper=self.squad, event=self.event)
+        candidates = (
+            self.event.interested.exclude(id=self.squad.id)
+            .exclude(id__in=swiped.values("swipee"))
+            .order_by("id")
+            .values_list("id", flat=True)[: REPEAT + 1]
+        )
+        url = reverse("event_stack", args=(self.event.id,))
+        self.measure(
+            "swipe",
+            [
+                lambda sid=sid: self.client.post(
+                    url, {"their_sid": sid, "match": "True"}
+                )
+                for sid in candidates
+            ],
+        )
+
+    def test_matches(self):
+        self.measure("matches", self.get(reverse("matches")))
+
+    def test_requests(self):
+        self.measure("requests", self.get(reverse("requests")))
+
+    def requesting_squads(self):
+        # New squads of one user each, every one asking to join ours.
+        squads = []
+        for i in range(REPEAT + 1):
+            squad = Squad.objects.create()
+            CustomUser.objects.create(
+                username=f"benchmark{i}", email=f"benchmark{i}@example.com", squad=squad
+            )
+            Request.objects.create(requester=squad, requestee=self.squad)
+            squads.append(squad)
+        return squads
+
+    def answer_requests(self, answer):
+        return [
+            lambda sid=squad.id: self.client.post(
+                reverse("requests"), {"their_sid": sid, answer: answer}
+            )
+            for squad in self.requesting_squads()
+        ]
+
+    def test_requests_accept(self):
+        self.measure("requests_accept", self.answer_requests("accept"))
+
+    def test_requests_deny(self):
+        self.measure("requests_deny", self.answer_requests("deny"))
@@ -1,11 +1,14 @@
-from .models import Request
+from django.utils.functional import SimpleLazyObject
 
 
 def get_requests(request):
-    try:
-        # User is logged in.
-        requests = Request.objects.filter(requestee=request.user.squad).count()
-    except AttributeError:
-        # User is not logged in.
-        requests = 0
-    return {"requests": requests}
+    def count_requests():
+        try:
+            # User is logged in.
+            return request.user.squad.pending_requests
+        except AttributeError:
+            # User is not logged in.
+            return 0
+
+    # Only read when a template actually shows the badge.
+    return {"requests": SimpleLazyObject(count_requests)}
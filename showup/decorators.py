@@ -0,0 +1,9 @@
+def query_budget(queries):
+    # Declares the most queries a view may make, however much data there is.
+    # QueryBudgetTests holds every view to its budget with small and large
+    # fixtures, so an N+1 shows up as a failing test.
+    def decorator(view):
+        view.query_budget = queries
+        return view
+
+    return decorator
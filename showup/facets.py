@@ -0,0 +1,69 @@
+from .models import Concert, Genre, SyncCheckpoint
+from django.core.cache import cache
+from django.db.models import Count
+
+FACETS_CACHE_KEY = "showup:facets"
+FACETS_TIMEOUT = 60 * 60
+
+
+def catalogue_version():
+    # The concerts only change when pull_seatgeek_data runs, and every run
+    # moves a checkpoint forward. Keying the cache on the latest checkpoint
+    # means a run invalidates the facets in every process, not just its own.
+    synced_at = (
+        SyncCheckpoint.objects.order_by("-synced_at")
+        .values_list("synced_at", flat=True)
+        .first()
+    )
+    return synced_at.timestamp() if synced_at else 0
+
+
+def compute_facets():
+    # The distinct values of every filter on the events page, with how many
+    # concerts have each of them.
+    concerts = Concert.objects.order_by()
+    borough_counts = dict(
+        concerts.values_list("borough").annotate(count=Count("id")).order_by()
+    )
+    return {
+        "venues": list(
+            concerts.values_list("venue_name")
+            .annotate(count=Count("id"))
+            .order_by("venue_name")
+        ),
+        "performers": list(
+            concerts.values_list("performer_names")
+            .annotate(count=Count("id"))
+            .order_by("performer_names")
+        ),
+        "genres": list(
+            Genre.objects.values_list("genre")
+            .annotate(count=Count("genres"))
+            .order_by("genre")
+        ),
+        "boroughs": [
+            (abbrev, name, borough_counts.get(abbrev, 0))
+            for abbrev, name in Concert.BOROUGH_CHOICES
+        ],
+    }
+
+
+def get_facets():
+    key = f"{FACETS_CACHE_KEY}:{catalogue_version()}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets()
+        cache.set(key, facets, FACETS_TIMEOUT)
+    return facets
+
+
+def invalidate_facets():
+    cache.delete(f"{FACETS_CACHE_KEY}:{catalogue_version()}")
+
+
+def performer_choices():
+    return [(name, name) for name, _ in get_facets()["performers"]]
+
+
+def venue_choices():
+    return [(name, name) for name, _ in get_facets()["venues"]]
@@ -1,5 +1,38 @@
+import binascii
 import django_filters
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from showup.facets import performer_choices, venue_choices
 from showup.models import Concert, Genre
+from showup.search import search_after, search_concerts
+
+
+def encode_cursor(concert):
+    # Points just past `concert` in the order of the listing: by search rank
+    # when searching, by date otherwise. Both are broken by id.
+    if getattr(concert, "search_rank", None) is not None:
+        position = f"r|{concert.search_rank!r}|{concert.id}"
+    else:
+        position = f"d|{concert.datetime.isoformat()}|{concert.id}"
+    return urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    # Returns the (field, value, id) a cursor points past, or None if it isn't
+    # one of ours.
+    try:
+        position = urlsafe_b64decode(cursor.encode()).decode()
+        kind, key, concert_id = position.split("|")
+        concert_id = int(concert_id)
+        if kind == "r":
+            return "search_rank", float(key), concert_id
+        if kind == "d" and parse_datetime(key) is not None:
+            return "datetime", parse_datetime(key), concert_id
+    except (binascii.Error, UnicodeError, ValueError):
+        pass
+    return None
 
 
 class ConcertFilter(django_filters.FilterSet):
@@ -9,15 +42,46 @@ class ConcertFilter(django_filters.FilterSet):
         widget=django_filters.widgets.RangeWidget(attrs={"type": "date"}),
     )
     borough = django_filters.MultipleChoiceFilter(choices=Concert.BOROUGH_CHOICES)
-    performers = django_filters.AllValuesMultipleFilter(field_name="performer_names")
-    venues = django_filters.AllValuesMultipleFilter(field_name="venue_name")
+    # The choices come from the cached facets instead of a DISTINCT scan of
+    # the concerts on every request.
+    performers = django_filters.MultipleChoiceFilter(
+        field_name="performer_names", choices=performer_choices
+    )
+    venues = django_filters.MultipleChoiceFilter(
+        field_name="venue_name", choices=venue_choices
+    )
     genres = django_filters.ModelMultipleChoiceFilter(
         field_name="genres__genre",
         to_field_name="genre",
         lookup_expr="contains",
         queryset=Genre.objects.all(),
     )
+    # Matches performers, venues and genres against the full-text index and
+    # lists the best matches first.
+    search = django_filters.CharFilter(method="filter_search")
+    # Keyset pagination: instead of an OFFSET, every page starts right after
+    # the last concert of the previous one, so deep pages cost the same as
+    # the first one.
+    after = django_filters.CharFilter(method="filter_after")
 
     class Meta:
         model = Concert
         fields = []
+
+    def filter_search(self, queryset, name, value):
+        return search_concerts(queryset, value)
+
+    def filter_after(self, queryset, name, value):
+        # The cursor only applies to the order it was made for, which depends
+        # on whether we're searching.
+        position = decode_cursor(value)
+        searching = "search_rank" in queryset.query.extra_select
+        ordering = "search_rank" if searching else "datetime"
+        if position is None or position[0] != ordering:
+            return queryset
+        field, key, concert_id = position
+        if searching:
+            return search_after(
+                queryset, self.form.cleaned_data["search"], key, concert_id
+            )
+        return queryset.filter(Q(datetime__gt=key) | Q(datetime=key, id__gt=concert_id))
@@ -0,0 +1,12 @@
+# This command writes a Match for every pair of squads that swiped right on
+# each other before matches were stored. Migration 0008 already does it on
+# deploy, so this is for repairs. It's safe to run more than once.
+
+from django.core.management.base import BaseCommand
+from showup.services import sync_matches
+
+
+class Command(BaseCommand):
+    def handle(self, *args, **options):
+        found = sync_matches()
+        self.stdout.write(f"Found {found} mutual right swipes")
@@ -1,7 +1,9 @@
 # This command deletes all concert data. Use with caution.
 
 from django.core.management.base import BaseCommand
-from showup.models import Concert
+from showup import search
+from showup.facets import invalidate_facets
+from showup.models import Concert, SyncCheckpoint
 import logging
 
 
@@ -16,6 +18,9 @@ class Command(BaseCommand):
 
         num_concerts = Concert.objects.count()
         Concert.objects.all().delete()
+        SyncCheckpoint.objects.all().delete()  # so the next pull starts over
+        search.clear_index()
+        invalidate_facets()
         logging.debug(
             "I deleted all " + str(num_concerts) + " concerts from the database"
         )
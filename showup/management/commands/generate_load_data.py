@@ -0,0 +1,237 @@
+# This command fills the database with random data, for load testing only.
+
+import random
+import time
+
+from allauth.account.admin import EmailAddress
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.timezone import now
+from itertools import accumulate
+from showup import search
+from showup.facets import invalidate_facets
+from showup.models import Concert, CustomUser, Genre, Squad, Swipe
+from showup.services import sync_matches
+
+# Squad sizes follow a Pareto distribution: most squads are one person, a
+# few are big groups of friends. This caps the tail.
+MAX_SQUAD_SIZE = 20
+
+# How many more swipes than asked for we'll try before giving up, since some
+# picks are duplicates or land on an event nobody else is going to.
+SWIPE_ATTEMPTS = 3
+
+# SQLite's page cache for the load, in KiB.
+SQLITE_CACHE_KB = 512 * 1024
+
+
+def next_id(model):
+    return (model.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+
+
+def popularity(items, rng, skew=1.1):
+    # Shuffles `items` and gives them Zipf-like cumulative weights, so a few
+    # of them (popular events, venues, genres) get picked most of the time.
+    items = list(items)
+    rng.shuffle(items)
+    return (
+        items,
+        list(accumulate(1 / rank ** skew for rank in range(1, len(items) + 1))),
+    )
+
+
+class Command(BaseCommand):
+    help = "Generates random users, squads, concerts and swipes for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100000)
+        parser.add_argument("--concerts", type=int, default=10000)
+        parser.add_argument("--genres", type=int, default=200)
+        parser.add_argument("--swipes", type=int, default=1000000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.started = time.perf_counter()
+
+        # One transaction, so SQLite only syncs to disk once, and a page cache
+        # big enough to hold the swipe indexes while they're being built.
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KB}")
+        with transaction.atomic():
+            concert_ids = self.make_concerts(options["concerts"], options["genres"])
+            squad_ids = self.make_users(options["users"])
+            attending = self.make_attendance(squad_ids, concert_ids)
+            self.make_swipes(attending, options["swipes"])
+            self.report(f"{sync_matches()} matches")
+            search.index_concerts(concert_ids)
+            invalidate_facets()
+
+            # Postgres doesn't move its sequences past ids we set ourselves.
+            models = [Genre, Squad, CustomUser]
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                    cursor.execute(sql)
+        self.report("done")
+
+    def report(self, message):
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(f"{elapsed:6.1f}s {message}")
+
+    def bulk_create(self, model, objs):
+        # Never more rows per INSERT than the database takes, which for SQLite
+        # is only a few hundred.
+        fields = model._meta.concrete_fields
+        batch_size = min(self.batch_size, connection.ops.bulk_batch_size(fields, objs))
+        model.objects.bulk_create(objs, batch_size=batch_size)
+
+    def insert_rows(self, model, columns, rows):
+        # For the big tables: building a model instance per row is what makes
+        # bulk_create slow at this size, so rows go straight to executemany.
+        quote = connection.ops.quote_name
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            quote(model._meta.db_table),
+            ", ".join(quote(column) for column in columns),
+            ", ".join(["%s"] * len(columns)),
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start:][: self.batch_size])
+
+    def make_concerts(self, count, genre_count):
+        rng = self.rng
+        first_genre = next_id(Genre)
+        genres = [
+            Genre(id=first_genre + i, genre=f"genre {first_genre + i}")
+            for i in range(genre_count)
+        ]
+        self.bulk_create(Genre, genres)
+        genre_ids, genre_weights = popularity((g.id for g in genres), rng)
+        # Users pick their favorite genres from these too.
+        self.genres = genre_ids, genre_weights
+
+        venues, venue_weights = popularity(
+            (f"Venue {i}" for i in range(count // 20 + 1)), rng
+        )
+        first_concert, start = next_id(Concert), now()
+        concerts, concert_genres = [], []
+        through = Concert.genres.through
+        for concert_id in range(first_concert, first_concert + count):
+            concerts.append(
+                Concert(
+                    id=concert_id,
+                    datetime=start + timedelta(minutes=rng.randrange(90 * 24 * 60)),
+                    venue_name=rng.choices(venues, cum_weights=venue_weights)[0],
+                    borough=rng.choice(Concert.BOROUGH_CHOICES)[0],
+                    performer_names=f"Performer {rng.randrange(count // 2 + 1)}",
+                    event_url=f"https://seatgeek.com/{concert_id}",
+                )
+            )
+            for genre_id in set(rng.choices(genre_ids, cum_weights=genre_weights, k=2)):
+                concert_genres.append(through(concert_id=concert_id, genre_id=genre_id))
+        self.bulk_create(Concert, concerts)
+        self.bulk_create(through, concert_genres)
+        self.report(f"{count} concerts, {genre_count} genres")
+        return [c.id for c in concerts]
+
+    def make_users(self, count):
+        rng = self.rng
+        # Every column of a user, as the database stores it, at its default.
+        defaults = {
+            field.column: field.get_db_prep_save(field.get_default(), connection)
+            for field in CustomUser._meta.concrete_fields
+        }
+        # Hashing is slow on purpose, so every user gets the same hash.
+        defaults["password"] = make_password("heyhey123")
+        columns = list(defaults)
+
+        genre_ids, genre_weights = self.genres
+        first_squad, first_user = next_id(Squad), next_id(CustomUser)
+        squads, users, emails, favorites = [], [], [], []
+        while len(users) < count:
+            squad_id = first_squad + len(squads)
+            squads.append(Squad(id=squad_id))
+            size = min(int(rng.paretovariate(1.6)), MAX_SQUAD_SIZE, count - len(users))
+            for _ in range(size):
+                user_id = first_user + len(users)
+                email = f"load{user_id}@example.com"
+                user = dict(
+                    defaults,
+                    id=user_id,
+                    username=email,
+                    email=email,
+                    first_name=f"Load{user_id}",
+                    squad_id=squad_id,
+                )
+                users.append(tuple(user[column] for column in columns))
+                emails.append((user_id, email, True, True))
+                # A few favorite genres, mostly the popular ones.
+                for genre_id in set(
+                    rng.choices(
+                        genre_ids, cum_weights=genre_weights, k=rng.randrange(4)
+                    )
+                ):
+                    favorites.append((user_id, genre_id))
+        self.bulk_create(Squad, squads)
+        self.insert_rows(CustomUser, columns, users)
+        self.insert_rows(
+            EmailAddress, ["user_id", "email", "verified", "primary"], emails
+        )
+        self.insert_rows(
+            CustomUser.genres.through, ["customuser_id", "genre_id"], favorites
+        )
+        self.report(f"{count} users in {len(squads)} squads")
+        return [squad.id for squad in squads]
+
+    def make_attendance(self, squad_ids, concert_ids):
+        # Every squad is interested in or going to a few events, mostly the
+        # popular ones. Returns the (squad, event) pairs.
+        rng = self.rng
+        concert_ids, concert_weights = popularity(concert_ids, rng)
+        interested = Squad.interested.through
+        going = Squad.going.through
+        attending, links = [], {interested: [], going: []}
+        for squad_id in squad_ids:
+            count = 1 + int(rng.expovariate(1 / 3))
+            for concert_id in set(
+                rng.choices(concert_ids, cum_weights=concert_weights, k=count)
+            ):
+                relation = going if rng.random() < 0.3 else interested
+                links[relation].append((squad_id, concert_id))
+                attending.append((squad_id, concert_id))
+        for relation, rows in links.items():
+            self.insert_rows(relation, ["squad_id", "concert_id"], rows)
+        self.report(f"{len(attending)} interested and going")
+        return attending
+
+    def make_swipes(self, attending, count):
+        # Squads swipe on the other squads that are going to the same event,
+        # so popular events get most of the swipes.
+        rng = self.rng
+        by_event = {}
+        for squad_id, concert_id in attending:
+            by_event.setdefault(concert_id, []).append(squad_id)
+
+        seen, swipes = set(), []
+        for _ in range(count * SWIPE_ATTEMPTS):
+            if len(swipes) == count:
+                break
+            swiper_id, concert_id = rng.choice(attending)
+            swipee_id = rng.choice(by_event[concert_id])
+            if swipee_id == swiper_id or (swiper_id, swipee_id, concert_id) in seen:
+                continue
+            seen.add((swiper_id, swipee_id, concert_id))
+            swipes.append((swiper_id, swipee_id, concert_id, rng.random() < 0.6))
+        # In the order of the unique index, which is then built by appending.
+        swipes.sort()
+        self.insert_rows(
+            Swipe, ["swiper_id", "swipee_id", "event_id", "direction"], swipes
+        )
+        self.report(f"{len(swipes)} swipes")
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.8 on 2026-10-18 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("showup", "0006_request"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "borough",
+                    models.TextField(
+                        choices=[
+                            ("BK", "Brooklyn"),
+                            ("MN", "Manhattan"),
+                            ("BX", "The Bronx"),
+                            ("QN", "Queens"),
+                            ("SI", "Staten Island"),
+                        ],
+                        unique=True,
+                    ),
+                ),
+                ("synced_at", models.DateTimeField()),
+                ("inserted", models.PositiveIntegerField(default=0)),
+                ("updated", models.PositiveIntegerField(default=0)),
+                ("unchanged", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="concert",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 2.2.8 on 2026-10-18 08:28
+
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef
+import django.db.models.deletion
+
+# How many matches are written per INSERT.
+BATCH_SIZE = 1000
+
+
+def backfill_matches(apps, schema_editor):
+    # A Match for every pair of squads that swiped right on each other
+    # before matches were stored, like services.sync_matches.
+    Match = apps.get_model("showup", "Match")
+    Swipe = apps.get_model("showup", "Swipe")
+    mutual = Swipe.objects.filter(
+        swiper=OuterRef("swipee"),
+        swipee=OuterRef("swiper"),
+        event=OuterRef("event"),
+        direction=True,
+    )
+    pairs = (
+        Swipe.objects.filter(direction=True, swiper__lt=F("swipee"))
+        .annotate(mutual=Exists(mutual))
+        .filter(mutual=True)
+        .values_list("swiper", "swipee", "event")
+    )
+    batch = []
+    for squad_1_id, squad_2_id, event_id in pairs.iterator():
+        batch.append(
+            Match(squad_1_id=squad_1_id, squad_2_id=squad_2_id, event_id=event_id)
+        )
+        if len(batch) == BATCH_SIZE:
+            Match.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Match.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("showup", "0007_sync_checkpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Match",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "event",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="matches",
+                        to="showup.Concert",
+                    ),
+                ),
+                (
+                    "squad_1",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="matches_as_squad_1",
+                        to="showup.Squad",
+                    ),
+                ),
+                (
+                    "squad_2",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="matches_as_squad_2",
+                        to="showup.Squad",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="match",
+            constraint=models.UniqueConstraint(
+                fields=("squad_1", "squad_2", "event"), name="Match_unique"
+            ),
+        ),
+        migrations.RunPython(backfill_matches, migrations.RunPython.noop),
+    ]
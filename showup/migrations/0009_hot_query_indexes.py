@@ -0,0 +1,61 @@
+# Generated by Django 2.2.8 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("showup", "0008_match"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="concert",
+            index=models.Index(fields=["datetime", "id"], name="concert_datetime_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="concert",
+            index=models.Index(
+                fields=["borough", "datetime"], name="concert_borough_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="concert",
+            index=models.Index(fields=["venue_name"], name="concert_venue_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="concert",
+            index=models.Index(
+                fields=["performer_names"], name="concert_performers_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="swipe",
+            index=models.Index(
+                fields=["swipee", "event", "direction"], name="swipe_swipee_event_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="swipe",
+            index=models.Index(
+                fields=["swiper", "event"], name="swipe_swiper_event_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="swipe",
+            index=models.Index(
+                condition=models.Q(direction=True),
+                fields=["swiper"],
+                name="swipe_right_swiper_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="swipe",
+            index=models.Index(
+                condition=models.Q(direction=True),
+                fields=["swipee"],
+                name="swipe_right_swipee_idx",
+            ),
+        ),
+    ]
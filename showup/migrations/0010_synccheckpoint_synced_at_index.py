@@ -0,0 +1,18 @@
+# Generated by Django 2.2.8 on 2026-10-18 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("showup", "0009_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="synccheckpoint",
+            name="synced_at",
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+from showup import search
+
+
+def create_search_index(apps, schema_editor):
+    search.create_index(schema_editor.connection)
+    search.rebuild_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("showup", "0010_synccheckpoint_synced_at_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.8 on 2026-10-18 08:44
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_pending_requests(apps, schema_editor):
+    Request = apps.get_model("showup", "Request")
+    Squad = apps.get_model("showup", "Squad")
+    pending = (
+        Request.objects.filter(requestee=OuterRef("pk"))
+        .order_by()
+        .values("requestee")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Squad.objects.update(
+        pending_requests=Coalesce(Subquery(pending, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("showup", "0011_concert_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="squad",
+            name="pending_requests",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_pending_requests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 2.2.8 on 2026-10-18 09:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("showup", "0012_squad_pending_requests"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CandidateQueue",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "event",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="queues",
+                        to="showup.Concert",
+                    ),
+                ),
+                (
+                    "squad",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="queues",
+                        to="showup.Squad",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="QueuedCandidate",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveIntegerField()),
+                (
+                    "candidate",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="showup.Squad",
+                    ),
+                ),
+                (
+                    "queue",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="candidates",
+                        to="showup.CandidateQueue",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="queuedcandidate",
+            index=models.Index(fields=["queue", "rank"], name="queue_rank_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="queuedcandidate",
+            constraint=models.UniqueConstraint(
+                fields=("queue", "candidate"), name="queued_candidate_unique"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="candidatequeue",
+            constraint=models.UniqueConstraint(
+                fields=("squad", "event"), name="queue_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+from showup import search
+
+
+def drop_foreign_key(apps, schema_editor):
+    # Search indexes made before this migration reference showup_concert on
+    # Postgres, which keeps Django from truncating it.
+    if search.is_postgres(schema_editor.connection):
+        schema_editor.execute(
+            f"ALTER TABLE {search.SEARCH_TABLE} "
+            f"DROP CONSTRAINT IF EXISTS {search.SEARCH_TABLE}_concert_id_fkey"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("showup", "0013_candidate_queues"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_foreign_key, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.8 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("showup", "0014_concert_search_no_foreign_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="candidatequeue",
+            name="complete",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name="candidatequeue",
+            name="generation",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="concert",
+            name="queue_generation",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
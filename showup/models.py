@@ -31,6 +31,20 @@ class Concert(models.Model):
     genres = models.ManyToManyField(Genre, related_name="genres", blank=True)
     event_url = models.URLField(max_length=100000)
     performer_image_url = models.URLField(max_length=100000, null=True)
+    # sha256 of the SeatGeek data we store, used to skip unchanged events.
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+    # Bumped whenever the squads at the event change in a way its candidate
+    # queues have to know about, which makes the queues built before stale.
+    queue_generation = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Concerts are always listed by date and filtered by these columns.
+        indexes = [
+            models.Index(fields=["datetime", "id"], name="concert_datetime_idx"),
+            models.Index(fields=["borough", "datetime"], name="concert_borough_idx"),
+            models.Index(fields=["venue_name"], name="concert_venue_idx"),
+            models.Index(fields=["performer_names"], name="concert_performers_idx"),
+        ]
 
     def __str__(self):
         return (
@@ -39,9 +53,23 @@ class Concert(models.Model):
         )
 
 
+class SyncCheckpoint(models.Model):
+    borough = models.TextField(choices=Concert.BOROUGH_CHOICES, unique=True)
+    synced_at = models.DateTimeField(db_index=True)
+    inserted = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.borough} synced at {str(self.synced_at)}"
+
+
 class Squad(models.Model):
     interested = models.ManyToManyField(Concert, related_name="interested", blank=True)
     going = models.ManyToManyField(Concert, related_name="going", blank=True)
+    # How many requests this squad has received and not answered yet, kept up
+    # to date by showup.signals so the header doesn't count them on every page.
+    pending_requests = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return str(self.id)
@@ -80,6 +108,24 @@ class Swipe(models.Model):
                 ),
             )
         ]
+        # The unique constraint above covers lookups by (swiper, swipee, event).
+        # These cover the other ways the views look swipes up.
+        indexes = [
+            models.Index(
+                fields=["swipee", "event", "direction"], name="swipe_swipee_event_idx"
+            ),
+            models.Index(fields=["swiper", "event"], name="swipe_swiper_event_idx"),
+            models.Index(
+                fields=["swiper"],
+                condition=models.Q(direction=True),
+                name="swipe_right_swiper_idx",
+            ),
+            models.Index(
+                fields=["swipee"],
+                condition=models.Q(direction=True),
+                name="swipe_right_swipee_idx",
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -90,6 +136,75 @@ class Swipe(models.Model):
         )
 
 
+class Match(models.Model):
+    # Two squads that swiped right on each other for an event. The squad with
+    # the smaller id is always squad_1.
+    squad_1 = models.ForeignKey(
+        Squad, on_delete=models.CASCADE, related_name="matches_as_squad_1"
+    )
+    squad_2 = models.ForeignKey(
+        Squad, on_delete=models.CASCADE, related_name="matches_as_squad_2"
+    )
+    event = models.ForeignKey(Concert, on_delete=models.CASCADE, related_name="matches")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["squad_1", "squad_2", "event"], name="Match_unique"
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f"Squad 1: {self.squad_1_id}, "
+            f"Squad 2: {self.squad_2_id}, "
+            f"Event: {self.event_id}"
+        )
+
+
+class CandidateQueue(models.Model):
+    # The best squads left for a squad to swipe on for an event, ranked on
+    # the first visit (see showup.queues) and consumed as it swipes. It's
+    # rebuilt on the next visit once the event's queue_generation moves past
+    # the one it was built at, or once it runs out.
+    squad = models.ForeignKey(Squad, on_delete=models.CASCADE, related_name="queues")
+    event = models.ForeignKey(Concert, on_delete=models.CASCADE, related_name="queues")
+    generation = models.PositiveIntegerField(default=0)
+    # Whether every candidate made it into the queue, rather than just the
+    # best ones. An empty queue that isn't complete has more to come.
+    complete = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["squad", "event"], name="queue_unique")
+        ]
+
+    def __str__(self):
+        return f"Squad: {self.squad_id}, Event: {self.event_id}"
+
+
+class QueuedCandidate(models.Model):
+    queue = models.ForeignKey(
+        CandidateQueue, on_delete=models.CASCADE, related_name="candidates"
+    )
+    candidate = models.ForeignKey(Squad, on_delete=models.CASCADE, related_name="+")
+    # The candidate's place in the queue, best first.
+    rank = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["queue", "candidate"], name="queued_candidate_unique"
+            )
+        ]
+        indexes = [models.Index(fields=["queue", "rank"], name="queue_rank_idx")]
+
+    def __str__(self):
+        return (
+            f"Queue: {self.queue_id}, Candidate: {self.candidate_id}, Rank: {self.rank}"
+        )
+
+
 class Request(models.Model):
     requester = models.ForeignKey(
         Squad, on_delete=models.CASCADE, related_name="requester"
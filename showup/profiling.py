@@ -0,0 +1,151 @@
+import heapq
+import threading
+import time
+
+from bisect import bisect_left
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+# Upper bounds, in milliseconds, of the buckets of the wall time histogram.
+# Anything slower lands in a last, unbounded bucket.
+BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# How many of the slowest statements we keep per request and per view.
+SLOWEST = 5
+
+# How much of a statement we keep, so the headers and the stats stay small.
+SQL_PREVIEW = 200
+
+
+class QueryTimer:
+    # A database execute wrapper that counts and times every statement.
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.duration += duration
+            keep_slowest(self.slowest, duration, sql)
+
+
+def keep_slowest(slowest, duration, sql):
+    # `slowest` is a min-heap of (ms, sql), so the fastest of the ones we
+    # kept is the one that gets pushed out.
+    entry = (duration, sql[:SQL_PREVIEW])
+    if len(slowest) < SLOWEST:
+        heapq.heappush(slowest, entry)
+    elif entry > slowest[0]:
+        heapq.heapreplace(slowest, entry)
+
+
+class ViewStats:
+    # Per-view totals and wall time histograms for the life of the process.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view, duration, timer):
+        with self.lock:
+            stats = self.views.setdefault(
+                view,
+                {
+                    "requests": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "queries": 0,
+                    "max_queries": 0,
+                    "sql_ms": 0.0,
+                    "histogram": [0] * (len(BUCKETS) + 1),
+                    "slowest": [],
+                },
+            )
+            stats["requests"] += 1
+            stats["total_ms"] += duration
+            stats["max_ms"] = max(stats["max_ms"], duration)
+            stats["queries"] += timer.count
+            stats["max_queries"] = max(stats["max_queries"], timer.count)
+            stats["sql_ms"] += timer.duration
+            stats["histogram"][bisect_left(BUCKETS, duration)] += 1
+            for sql_duration, sql in timer.slowest:
+                keep_slowest(stats["slowest"], sql_duration, sql)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                view: {
+                    "requests": stats["requests"],
+                    "mean_ms": round(stats["total_ms"] / stats["requests"], 3),
+                    "max_ms": round(stats["max_ms"], 3),
+                    "mean_queries": round(stats["queries"] / stats["requests"], 3),
+                    "max_queries": stats["max_queries"],
+                    "mean_sql_ms": round(stats["sql_ms"] / stats["requests"], 3),
+                    "histogram": {
+                        f"<={bound}ms" if bound else "slower": count
+                        for bound, count in zip(BUCKETS + [None], stats["histogram"])
+                    },
+                    "slowest": [
+                        {"ms": round(duration, 3), "sql": sql}
+                        for duration, sql in sorted(stats["slowest"], reverse=True)
+                    ],
+                }
+                for view, stats in sorted(self.views.items())
+            }
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+stats = ViewStats()
+
+
+def server_timing(duration, timer, statements):
+    # app and db totals, then, if `statements`, the slowest statements, slowest
+    # first.
+    metrics = [
+        f"app;dur={duration:.1f}",
+        f'db;dur={timer.duration:.1f};desc="{timer.count} queries"',
+    ]
+    if not statements:
+        return ", ".join(metrics)
+    for i, (sql_duration, sql) in enumerate(sorted(timer.slowest, reverse=True), 1):
+        # Header values have to be a single line of ASCII without quotes.
+        desc = " ".join(sql.split())[:80].encode("ascii", "replace").decode()
+        desc = desc.replace("\\", "").replace('"', "'")
+        metrics.append(f'sql-{i};dur={sql_duration:.1f};desc="{desc}"')
+    return ", ".join(metrics)
+
+
+class ProfilingMiddleware:
+    # Times every request and its SQL. Only switched on when SHOWUP_PROFILING
+    # is set, since it costs a little on every statement.
+    def __init__(self, get_response):
+        if not getattr(settings, "SHOWUP_PROFILING", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = (time.perf_counter() - start) * 1000
+
+        # The statements give away our SQL, so only staff get to see them.
+        # Middleware that answers before AuthenticationMiddleware, like the
+        # session timeout's redirect, leaves the request without a user.
+        user = getattr(request, "user", None)
+        statements = settings.DEBUG or getattr(user, "is_staff", False)
+        response["Server-Timing"] = server_timing(duration, timer, statements)
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        stats.record(view, duration, timer)
+        return response
@@ -0,0 +1,115 @@
+from .models import CandidateQueue, Concert, QueuedCandidate, Squad, Swipe
+from .ranking import rank_squads
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+
+# How many of the best candidates a queue holds. It's topped up from the
+# rest of the event once they're all swiped on.
+QUEUE_SIZE = 100
+
+
+def next_candidates(squad_id, event_id, limit):
+    # The first `limit` squads of the squad's queue for the event that are
+    # still at the event, with their members. The queue is built on the first
+    # visit, and rebuilt when it's stale or has run out.
+    queue = (
+        CandidateQueue.objects.filter(squad=squad_id, event=event_id)
+        .annotate(current=F("event__queue_generation"))
+        .first()
+    )
+    if queue is None or queue.generation != queue.current:
+        queue = build_queue(squad_id, event_id)
+    candidates = queued_candidates(queue, event_id, limit)
+    if not candidates and not queue.complete:
+        queue = build_queue(squad_id, event_id)
+        candidates = queued_candidates(queue, event_id, limit)
+    return candidates
+
+
+def queued_candidates(queue, event_id, limit):
+    # Squads that left the event since the queue was built are skipped here,
+    # so leaving doesn't have to touch anybody's queue.
+    interested = Squad.interested.through.objects.filter(
+        squad=OuterRef("candidate"), concert=event_id
+    )
+    going = Squad.going.through.objects.filter(
+        squad=OuterRef("candidate"), concert=event_id
+    )
+    candidates = (
+        queue.candidates.annotate(interested=Exists(interested), going=Exists(going))
+        .filter(Q(interested=True) | Q(going=True))
+        .order_by("rank")
+        .select_related("candidate")
+        .prefetch_related("candidate__squad")
+    )
+    return [c.candidate for c in candidates[:limit]]
+
+
+@transaction.atomic
+def build_queue(squad_id, event_id):
+    # The generation is read first, so a squad joining while we rank makes
+    # this queue stale rather than leaving it out for good.
+    generation = Concert.objects.values_list("queue_generation", flat=True).get(
+        id=event_id
+    )
+
+    # The squads interested in or going to the event.
+    interested = Squad.interested.through.objects.filter(concert=event_id)
+    going = Squad.going.through.objects.filter(concert=event_id)
+    attending = Squad.objects.filter(
+        Q(id__in=interested.values("squad")) | Q(id__in=going.values("squad"))
+    )
+
+    """
+    Exclude the following squads:
+    - The squads that swiped left on my squad.
+    - The squads that my squad swiped on.
+    - My squad.
+    Everyone else going is ranked by how well they'd get along with my squad,
+    and the best of them are queued. The squads to exclude are few, so
+    they're dropped after ranking, which keeps the ranking queries simple.
+    """
+    swiped_left = Swipe.objects.filter(swipee=squad_id, event=event_id, direction=False)
+    swiped = Swipe.objects.filter(swiper=squad_id, event=event_id)
+    excluded = set(
+        swiped_left.values_list("swiper", flat=True).union(
+            swiped.values_list("swipee", flat=True)
+        )
+    )
+    ranked = [i for i in rank_squads(squad_id, attending) if i not in excluded]
+    complete = len(ranked) <= QUEUE_SIZE
+    # Locked, so two rebuilds of the queue take turns.
+    queue, created = CandidateQueue.objects.select_for_update().get_or_create(
+        squad_id=squad_id,
+        event_id=event_id,
+        defaults={"generation": generation, "complete": complete},
+    )
+    if not created:
+        queue.generation, queue.complete = generation, complete
+        queue.save(update_fields=["generation", "complete"])
+        queue.candidates.all().delete()
+    QueuedCandidate.objects.bulk_create(
+        QueuedCandidate(queue=queue, candidate_id=candidate_id, rank=rank)
+        for rank, candidate_id in enumerate(ranked[:QUEUE_SIZE])
+    )
+    return queue
+
+
+def consume_candidates(swiper_id, event_id, swipes):
+    # Swipes, as (swipee id, direction) pairs, take the swipees out of the
+    # swiper's queue, and left swipes take the swiper out of the swipees'
+    # queues too. One indexed DELETE, however many swipes there are.
+    swipes = list(swipes)
+    swiped = Q(queue__squad=swiper_id, candidate__in=[s for s, _ in swipes])
+    swiped_left = [s for s, direction in swipes if not direction]
+    if swiped_left:
+        swiped |= Q(queue__squad__in=swiped_left, candidate=swiper_id)
+    QueuedCandidate.objects.filter(swiped, queue__event=event_id).delete()
+
+
+def invalidate_queues(event_ids):
+    # Makes every queue for the events stale, to be rebuilt on its owner's
+    # next visit. One UPDATE, however many queues there are.
+    Concert.objects.filter(id__in=event_ids).update(
+        queue_generation=F("queue_generation") + 1
+    )
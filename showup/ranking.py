@@ -0,0 +1,69 @@
+import numpy as np
+
+from .models import CustomUser, Squad
+from django.db.models import Count, Q
+
+# How much each signal counts towards a squad's place in the stack. Every
+# signal is between 0 and 1.
+GENRE_WEIGHT = 1.0
+INTEREST_WEIGHT = 1.0
+SIZE_WEIGHT = 0.5
+
+
+def rank_squads(sid, squads):
+    # Orders the squads of the `squads` queryset by how well they'd get along
+    # with squad `sid`, best first, and returns their ids. Squads are scored
+    # on the genres their users like, the events they're interested in or
+    # going to, and how close their size is to ours. `squads` is a subquery
+    # of every query here, so it should be cheap to run.
+    squads = Squad.objects.filter(Q(id__in=squads.values("id")) | Q(id=sid))
+    rows = squads.annotate(size=Count("squad")).order_by("id").values_list("id", "size")
+    ids, sizes = np.array(list(rows), dtype=np.int64).reshape(-1, 2).T
+    me = np.searchsorted(ids, sid)
+    if me == len(ids) or ids[me] != sid:
+        # We're not a squad, so there's nothing to compare with.
+        return ids.tolist()
+
+    # Every (squad, genre) and (squad, event) pair, which is all the ranking
+    # works on, so it's a handful of array operations however many squads
+    # there are.
+    through = CustomUser.genres.through.objects.filter(customuser__squad__in=squads)
+    genres = pairs(ids, through.values_list("customuser__squad", "genre"))
+    interested = Squad.interested.through.objects.filter(squad__in=squads)
+    going = Squad.going.through.objects.filter(squad__in=squads)
+    events = pairs(
+        ids,
+        interested.values_list("squad", "concert").union(
+            going.values_list("squad", "concert"), all=True
+        ),
+    )
+
+    scores = (
+        GENRE_WEIGHT * overlap(genres, me, len(ids))
+        + INTEREST_WEIGHT * overlap(events, me, len(ids))
+        + SIZE_WEIGHT / (1 + np.abs(sizes - sizes[me]))
+    )
+
+    # Best first, the lowest id breaking ties, and without us.
+    order = np.lexsort((ids, -scores))
+    return [i for i in ids[order].tolist() if i != sid]
+
+
+def pairs(ids, rows):
+    # (index of the squad in `ids`, item) pairs, each one once.
+    rows = np.array(list(rows), dtype=np.int64).reshape(-1, 2)
+    squads, items = np.searchsorted(ids, rows[:, 0]), rows[:, 1]
+    # One int per pair makes finding the unique ones a flat sort.
+    width = int(items.max()) + 1 if len(items) else 1
+    keys = np.unique(squads * width + items)
+    return np.stack([keys // width, keys % width], axis=1)
+
+
+def overlap(pairs, me, count):
+    # How much of what each squad has in `pairs` our squad `me` has too, as
+    # the size of the intersection over the size of the union.
+    mine = pairs[pairs[:, 0] == me, 1]
+    shared = pairs[np.isin(pairs[:, 1], mine), 0]
+    shared = np.bincount(shared, minlength=count).astype(float)
+    union = np.bincount(pairs[:, 0], minlength=count) + len(mine) - shared
+    return np.divide(shared, union, out=np.zeros(count), where=union > 0)
@@ -0,0 +1,158 @@
+import re
+
+from django.db import connection
+
+# The full-text index lives in its own table next to showup_concert: an FTS5
+# table on SQLite, a GIN-indexed tsvector on Postgres. Either way it has one
+# row per concert, keyed by the concert's id. There's no foreign key, which
+# Django doesn't know about and would stop it from truncating showup_concert.
+# Searches join the concerts, so rows left behind by deleted ones never match.
+SEARCH_TABLE = "showup_concert_search"
+
+# How many concerts are reindexed per statement, well under SQLite's limit on
+# query parameters.
+INDEX_BATCH_SIZE = 500
+
+# Performers count the most, then venues, then genres.
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+    "performers, venue, genres, tokenize = 'unicode61 remove_diacritics 2')",
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) "
+    "VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')",
+]
+POSTGRES_SCHEMA = [
+    f"CREATE TABLE {SEARCH_TABLE} ("
+    "concert_id integer PRIMARY KEY, document tsvector NOT NULL)",
+    f"CREATE INDEX {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} "
+    "USING GIN (document)",
+]
+
+SQLITE_INDEX = f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, performers, venue, genres)
+    SELECT c.id, c.performer_names, c.venue_name,
+           COALESCE(group_concat(g.genre, ' '), '')
+    FROM showup_concert c
+    LEFT JOIN showup_concert_genres cg ON cg.concert_id = c.id
+    LEFT JOIN showup_genre g ON g.id = cg.genre_id
+    {{where}}
+    GROUP BY c.id
+"""
+POSTGRES_INDEX = f"""
+    INSERT INTO {SEARCH_TABLE} (concert_id, document)
+    SELECT c.id,
+           setweight(to_tsvector('simple', c.performer_names), 'A')
+           || setweight(to_tsvector('simple', c.venue_name), 'B')
+           || setweight(
+               to_tsvector('simple', COALESCE(string_agg(g.genre, ' '), '')), 'C'
+           )
+    FROM showup_concert c
+    LEFT JOIN showup_concert_genres cg ON cg.concert_id = c.id
+    LEFT JOIN showup_genre g ON g.id = cg.genre_id
+    {{where}}
+    GROUP BY c.id
+"""
+
+
+def is_postgres(conn=connection):
+    return conn.vendor == "postgresql"
+
+
+def key_column(conn=connection):
+    return "concert_id" if is_postgres(conn) else "rowid"
+
+
+def create_index(conn=connection):
+    with conn.cursor() as cursor:
+        for statement in POSTGRES_SCHEMA if is_postgres(conn) else SQLITE_SCHEMA:
+            cursor.execute(statement)
+
+
+def drop_index(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {SEARCH_TABLE}")
+
+
+def rebuild_index(conn=connection):
+    # Reindexes every concert, for when the index is new or out of sync.
+    clear_index(conn)
+    index_sql = POSTGRES_INDEX if is_postgres(conn) else SQLITE_INDEX
+    with conn.cursor() as cursor:
+        cursor.execute(index_sql.format(where=""))
+
+
+def clear_index(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+
+def index_concerts(concert_ids, conn=connection):
+    # Rewrites the index rows of the given concerts from what's in the
+    # database now. Called by the ingestion for every concert it writes.
+    concert_ids = list(concert_ids)
+    index_sql = POSTGRES_INDEX if is_postgres(conn) else SQLITE_INDEX
+    with conn.cursor() as cursor:
+        for start in range(0, len(concert_ids), INDEX_BATCH_SIZE):
+            batch = concert_ids[start:][:INDEX_BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} "
+                f"WHERE {key_column(conn)} IN ({placeholders})",
+                batch,
+            )
+            cursor.execute(
+                index_sql.format(where=f"WHERE c.id IN ({placeholders})"), batch
+            )
+
+
+def parse_query(query):
+    # Turns what the user typed into a query every backend accepts: each word
+    # must match the start of a word in the index. Punctuation is dropped, so
+    # nothing the user types can break the query syntax.
+    words = re.findall(r"\w+", query.lower())
+    if is_postgres():
+        return " & ".join(f"{word}:*" for word in words)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def match_sql():
+    if is_postgres():
+        return f"{SEARCH_TABLE}.document @@ to_tsquery('simple', %s)"
+    return f"{SEARCH_TABLE} MATCH %s"
+
+
+def rank_sql(match):
+    # The relevance of a match, lower being better, and its query parameters.
+    if is_postgres():
+        # ts_rank is a real, whose value a Python float in a cursor can't spell
+        # exactly. As a double it can, so search_after compares like for like.
+        rank = f"-ts_rank({SEARCH_TABLE}.document, to_tsquery('simple', %s))::float8"
+        return rank, [match]
+    return f"{SEARCH_TABLE}.rank", []
+
+
+def search_concerts(queryset, query):
+    # Narrows a Concert queryset down to the concerts matching `query`, best
+    # matches first. The index is joined rather than queried once per concert,
+    # so the rank of every match comes out of a single lookup. Each result
+    # has a search_rank so the listing can page through them with a cursor.
+    match = parse_query(query)
+    if not match:
+        return queryset
+    rank, rank_params = rank_sql(match)
+    return queryset.extra(
+        select={"search_rank": rank},
+        select_params=rank_params,
+        tables=[SEARCH_TABLE],
+        where=[f"{SEARCH_TABLE}.{key_column()} = showup_concert.id", match_sql()],
+        params=[match],
+    ).order_by("search_rank", "id")
+
+
+def search_after(queryset, query, search_rank, concert_id):
+    # Keyset pagination over search_concerts(queryset, query): only keeps the
+    # matches that come after (search_rank, concert_id).
+    rank, rank_params = rank_sql(parse_query(query))
+    return queryset.extra(
+        where=[f"({rank} > %s OR ({rank} = %s AND showup_concert.id > %s))"],
+        params=rank_params + [search_rank] + rank_params + [search_rank, concert_id],
+    )
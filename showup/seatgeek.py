@@ -0,0 +1,238 @@
+import hashlib
+import math
+import requests
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from django.db import transaction
+from django.utils.timezone import make_aware
+from requests.adapters import HTTPAdapter
+from showup import search
+from showup.models import Concert, Genre
+from urllib3.util.retry import Retry
+
+BASE_URL = "https://api.seatgeek.com/2/events"
+CLIENT_ID = "MTg3MzUxNzB8MTU3MDE1NTY1OS45MQ"
+
+# it's important that Manhattan is last because it's very badly
+# represented by a circle. So we do the other boroughs first so that the
+# inevitable overlap from MN's circle won't misassign concerts to MN.
+BOROUGHS = [
+    ("BK", {"lat": "40.643222", "lon": "-73.949258", "range": "5mi"}),
+    ("QN", {"lat": "40.720977", "lon": "-73.810735", "range": "6.5mi"}),
+    ("BX", {"lat": "40.859827", "lon": "-73.862867", "range": "4mi"}),
+    ("SI", {"lat": "40.573586", "lon": "-74.158318", "range": "5.8mi"}),
+    ("MN", {"lat": "40.779527", "lon": "-73.966263", "range": "6mi"}),
+]
+
+# SeatGeek answers 429 when we go over the rate limit and the occasional 5xx
+# when it's having a bad day. Both are worth retrying.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# The columns we take from SeatGeek and overwrite when an event changes.
+CONCERT_FIELDS = [
+    "datetime",
+    "venue_name",
+    "performer_names",
+    "event_url",
+    "performer_image_url",
+]
+
+
+def make_session(workers, retries, backoff):
+    # One keep-alive session shared by every worker thread. The connection
+    # pool is as big as the thread pool so no worker waits for a connection.
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        method_whitelist=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=workers, pool_maxsize=workers, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def borough_params(location, per_page, horizon):
+    params = {
+        "client_id": CLIENT_ID,
+        "per_page": per_page,
+        "taxonomies.name": "concert",
+        "sort": "datetime_utc.asc",
+    }
+    if horizon is not None:
+        params["datetime_utc.lte"] = horizon.strftime("%Y-%m-%dT%H:%M:%S")
+    params.update(location)
+    return params
+
+
+def fetch_page(session, url, params, timeout):
+    response = session.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def crawl(
+    url=BASE_URL,
+    workers=5,
+    timeout=10,
+    retries=3,
+    backoff=0.5,
+    per_page=100,
+    horizon=None,
+):
+    # Yields (borough, events) one page at a time, following meta.total until
+    # every page up to the horizon has been read. The first page of every
+    # borough is requested at once, then the rest of a borough's pages are
+    # fetched ahead of the caller, never more than `workers` at a time, so
+    # memory stays flat however many events there are. Pages come back in
+    # the order of BOROUGHS so the caller still assigns Manhattan last.
+    session = make_session(workers, retries, backoff)
+    with session, ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def request(params, page):
+            return executor.submit(
+                fetch_page, session, url, dict(params, page=page), timeout
+            )
+
+        first_pages = []
+        for borough_abbrev, location in BOROUGHS:
+            params = borough_params(location, per_page, horizon)
+            first_pages.append((borough_abbrev, params, request(params, 1)))
+
+        for borough_abbrev, params, first_page in first_pages:
+            response = first_page.result()
+            yield borough_abbrev, response["events"]
+
+            meta = response["meta"]
+            last_page = math.ceil(meta["total"] / meta["per_page"])
+            next_page, pending = 2, deque()
+            while pending or next_page <= last_page:
+                while next_page <= last_page and len(pending) < workers:
+                    pending.append(request(params, next_page))
+                    next_page += 1
+                yield borough_abbrev, pending.popleft().result()["events"]
+
+
+def parse_concert(concert, borough_abbrev):
+    perf_name_list = [p["name"] for p in concert["performers"]]
+    # each concert has a list of performers so we
+    # add the name of each performer to this list
+
+    genres_set = set()
+    for perf in concert["performers"]:
+        # each concert has a list of performers and each performer has
+        # a list of genres. So we add all genres from all performers to
+        # genres_set. We use a set because there's
+        # no reason to have duplicated genres.
+        if "genres" in perf:
+            for g in perf["genres"]:
+                genres_set.add(g["name"])
+
+    aware_date = make_aware(
+        datetime.strptime(concert["datetime_local"], "%Y-%m-%dT%H:%M:%S")
+    )
+    # We need to make the time given by the API into a timezone-aware
+    # time, because Django will complain otherwise
+
+    curr_concert = Concert(
+        id=concert["id"],
+        datetime=aware_date,
+        venue_name=concert["venue"]["name_v2"],
+        borough=borough_abbrev,
+        performer_names=", ".join(perf_name_list),
+        event_url=concert["url"],
+        performer_image_url=concert["performers"][0]["image"],
+    )
+    return curr_concert, genres_set
+
+
+def content_hash(curr_concert, genres_set):
+    # Fingerprint of everything we copy from SeatGeek, so a later run can tell
+    # whether an event changed without reading the row back.
+    content = [str(getattr(curr_concert, field)) for field in CONCERT_FIELDS]
+    content += sorted(genres_set)
+    return hashlib.sha256("\x1f".join(content).encode()).hexdigest()
+
+
+@transaction.atomic
+def save_concerts(concert_list, borough_abbrev):
+    # Writes a whole page of events with a fixed number of queries, no matter
+    # how many events or genres are on the page. Only concerts whose content
+    # hash differs from the stored one are rewritten. Returns how many
+    # concerts were inserted, updated and left unchanged, and how long each
+    # stage of the write took.
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    timings = {"diff": 0.0, "genres": 0.0, "insert": 0.0, "update": 0.0, "index": 0.0}
+
+    start = time.perf_counter()
+    parsed = {}
+    for concert in concert_list:
+        if concert["id"] not in parsed:
+            curr_concert, genres_set = parse_concert(concert, borough_abbrev)
+            curr_concert.content_hash = content_hash(curr_concert, genres_set)
+            parsed[concert["id"]] = curr_concert, genres_set
+
+    known = dict(
+        Concert.objects.filter(id__in=list(parsed)).values_list("id", "content_hash")
+    )
+    new_concerts, changed_concerts = [], []
+    for concert_id, (curr_concert, genres_set) in parsed.items():
+        if concert_id not in known:
+            new_concerts.append(curr_concert)
+        elif known[concert_id] != curr_concert.content_hash:
+            changed_concerts.append(curr_concert)
+    counts["inserted"] = len(new_concerts)
+    counts["updated"] = len(changed_concerts)
+    counts["unchanged"] = len(parsed) - len(new_concerts) - len(changed_concerts)
+    timings["diff"] = time.perf_counter() - start
+
+    # Resolve the genres of every concert we're writing: insert the ones we've
+    # never seen, then read all of them back to get their ids.
+    start = time.perf_counter()
+    through = Concert.genres.through
+    genre_names = set().union(
+        *(parsed[c.id][1] for c in new_concerts + changed_concerts)
+    )
+    genre_ids = {}
+    if genre_names:
+        Genre.objects.bulk_create(
+            [Genre(genre=name) for name in genre_names], ignore_conflicts=True
+        )
+        genre_ids = dict(
+            Genre.objects.filter(genre__in=genre_names).values_list("genre", "id")
+        )
+    timings["genres"] = time.perf_counter() - start
+
+    def genre_rows(concerts):
+        return [
+            through(concert_id=c.id, genre_id=genre_ids[genre])
+            for c in concerts
+            for genre in parsed[c.id][1]
+        ]
+
+    # The borough is left alone on update: whichever borough saw an event
+    # first keeps it.
+    start = time.perf_counter()
+    Concert.objects.bulk_create(new_concerts)
+    through.objects.bulk_create(genre_rows(new_concerts), ignore_conflicts=True)
+    timings["insert"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Concert.objects.bulk_update(changed_concerts, CONCERT_FIELDS + ["content_hash"])
+    through.objects.filter(concert_id__in=[c.id for c in changed_concerts]).delete()
+    through.objects.bulk_create(genre_rows(changed_concerts), ignore_conflicts=True)
+    timings["update"] = time.perf_counter() - start
+
+    # Keep the full-text index in step with what we just wrote.
+    start = time.perf_counter()
+    search.index_concerts(c.id for c in new_concerts + changed_concerts)
+    timings["index"] = time.perf_counter() - start
+    return counts, timings
@@ -0,0 +1,299 @@
+from .models import CustomUser, Match, Request, Squad, Swipe
+from .queues import consume_candidates, invalidate_queues
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+# How many matches the backfill writes per INSERT.
+MATCH_BATCH_SIZE = 1000
+
+# What a squad can be to an event, besides nothing (None). Each is a many to
+# many field of Squad, and a squad is at most one of them for an event.
+INTERESTED = "interested"
+GOING = "going"
+ATTENDANCE = (INTERESTED, GOING)
+
+
+def move_rows(rows, field, winner, taken):
+    # Points `field` of every row in `rows` at the winner, except the rows
+    # for which `taken` (a subquery on OuterRef) finds the winner already
+    # has an equivalent row. Those are left to be deleted with the loser.
+    movable = rows.annotate(taken=Exists(taken)).filter(taken=False).values("pk")
+    rows.model.objects.filter(pk__in=movable).update(**{field: winner})
+
+
+# Adds an event to one of a squad's lists, if it isn't there already.
+ATTEND = """
+    INSERT INTO {table} (squad_id, concert_id) VALUES (%s, %s)
+    ON CONFLICT DO NOTHING
+"""
+
+
+@transaction.atomic
+def set_attendance(squad_id, event_id, status):
+    # Makes the squad interested in or going to the event, or neither if
+    # `status` is None. Setting the same status twice changes nothing. That's
+    # at most two statements, with no reads, plus one to make the event's
+    # candidate queues stale if the squad joined it.
+    if status is None:
+        # Queues skip squads that have left, so they can stay as they are.
+        for other in ATTENDANCE:
+            unattend(squad_id, event_id, other)
+        return
+
+    (other,) = (other for other in ATTENDANCE if other != status)
+    switched = unattend(squad_id, event_id, other)
+    table = Squad._meta.get_field(status).remote_field.through._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(ATTEND.format(table=table), [squad_id, event_id])
+        joined = cursor.rowcount == 1 and not switched
+
+    # Squads joining the event belong in its candidate queues.
+    if joined:
+        invalidate_queues([event_id])
+
+
+def unattend(squad_id, event_id, status):
+    # Takes the event off one of the squad's lists. Returns how many rows went.
+    through = Squad._meta.get_field(status).remote_field.through
+    deleted, _ = through.objects.filter(squad=squad_id, concert=event_id).delete()
+    return deleted
+
+
+@transaction.atomic
+def merge_squads(winner, loser):
+    # Folds the loser squad into the winner and deletes it. Every step is a
+    # set-based statement, so the number of queries doesn't depend on how big
+    # either squad is.
+    interested = Squad.interested.through
+    going = Squad.going.through
+
+    # Move their members.
+    CustomUser.objects.filter(squad=loser).update(squad=winner)
+
+    # Add their going events.
+    winner_going = going.objects.filter(squad=winner).values("concert")
+    going.objects.filter(squad=loser).exclude(concert__in=winner_going).update(
+        squad=winner
+    )
+
+    # If an event is in going then it can't be in interested.
+    interested.objects.filter(squad=winner, concert__in=winner_going).delete()
+
+    # Add their interested events, unless we're already interested or going.
+    winner_interested = interested.objects.filter(squad=winner).values("concert")
+    interested.objects.filter(squad=loser).exclude(
+        concert__in=winner_interested
+    ).exclude(concert__in=winner_going).update(squad=winner)
+
+    # Their swipes become ours, unless we already swiped on that squad for that
+    # event or the swipe is between the two squads being merged.
+    move_rows(
+        Swipe.objects.filter(swiper=loser).exclude(swipee=winner),
+        "swiper",
+        winner,
+        Swipe.objects.filter(
+            swiper=winner, swipee=OuterRef("swipee"), event=OuterRef("event")
+        ),
+    )
+    move_rows(
+        Swipe.objects.filter(swipee=loser).exclude(swiper=winner),
+        "swipee",
+        winner,
+        Swipe.objects.filter(
+            swiper=OuterRef("swiper"), swipee=winner, event=OuterRef("event")
+        ),
+    )
+
+    # Same for the requests they sent and received.
+    move_rows(
+        Request.objects.filter(requester=loser).exclude(requestee=winner),
+        "requester",
+        winner,
+        Request.objects.filter(requester=winner, requestee=OuterRef("requestee")),
+    )
+    move_rows(
+        Request.objects.filter(requestee=loser).exclude(requester=winner),
+        "requestee",
+        winner,
+        Request.objects.filter(requester=OuterRef("requester"), requestee=winner),
+    )
+
+    # Delete their old squad, along with anything we didn't move over. Their
+    # matches go with it and are rebuilt from the swipes we just moved.
+    Squad.objects.filter(id=loser.id).delete()
+    sync_matches(winner)
+
+    # Our swipes, size and events changed, so the queues of the events we're
+    # at no longer hold.
+    invalidate_queues(
+        interested.objects.filter(squad=winner)
+        .values("concert")
+        .union(going.objects.filter(squad=winner).values("concert"))
+    )
+
+    # The requests they received are ours now.
+    refresh_request_counts([winner.id])
+
+
+def make_match(squad_a_id, squad_b_id, event_id):
+    squad_1_id, squad_2_id = sorted((int(squad_a_id), int(squad_b_id)))
+    return Match(squad_1_id=squad_1_id, squad_2_id=squad_2_id, event_id=event_id)
+
+
+# Saves the match of two squads if they both swiped right on each other, in
+# one statement. Matches that already exist are left alone.
+MATCH_IF_MUTUAL = """
+    INSERT INTO {match} (squad_1_id, squad_2_id, event_id)
+    SELECT %s, %s, %s
+    WHERE (
+        SELECT COUNT(*) FROM {swipe}
+        WHERE event_id = %s AND direction = %s AND (
+            (swiper_id = %s AND swipee_id = %s) OR (swiper_id = %s AND swipee_id = %s)
+        )
+    ) = 2
+    ON CONFLICT DO NOTHING
+""".format(
+    match=Match._meta.db_table, swipe=Swipe._meta.db_table
+)
+
+
+def lock_squads(ids):
+    # Locks the squads' rows until the end of the transaction, so two
+    # transactions swiping between the same squads run one after the other,
+    # and the second sees the swipe of the first. They're locked in id order
+    # so two transactions can't wait on each other. SQLite only lets one
+    # transaction write at a time, so there's nothing to lock there.
+    if connection.features.has_select_for_update:
+        locked = Squad.objects.select_for_update().filter(id__in=ids).order_by("id")
+        list(locked.values_list("id", flat=True))
+
+
+@transaction.atomic
+def record_swipe(swiper_id, swipee_id, event_id, direction):
+    # Saves a swipe and, if it's the second right swipe between the two
+    # squads for this event, the match. Returns whether they matched.
+    if direction:
+        lock_squads([swiper_id, swipee_id])
+    # A swipe that was already made, like on a double click, is left as it was.
+    Swipe.objects.bulk_create(
+        [
+            Swipe(
+                swiper_id=swiper_id,
+                swipee_id=swipee_id,
+                event_id=event_id,
+                direction=direction,
+            )
+        ],
+        ignore_conflicts=True,
+    )
+    consume_candidates(swiper_id, event_id, [(swipee_id, direction)])
+    if not direction:
+        return False
+
+    # Check to see if their squad swiped right on our squad, and our swipe
+    # as it stands is right too, and save the match if so.
+    match = make_match(swiper_id, swipee_id, event_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            MATCH_IF_MUTUAL,
+            [match.squad_1_id, match.squad_2_id, event_id, event_id, True]
+            + [swiper_id, swipee_id, swipee_id, swiper_id],
+        )
+        return cursor.rowcount == 1
+
+
+@transaction.atomic
+def record_swipes(swiper_id, event_id, swipes):
+    # Saves a batch of swipes by one squad for one event, as (swipee id,
+    # direction) pairs, and the matches they make. Swipes that were already
+    # made are left as they were. Returns the ids of the squads we newly
+    # matched with. A constant number of queries, however big the batch.
+    lock_squads(
+        [swiper_id] + [swipee_id for swipee_id, direction in swipes if direction]
+    )
+    Swipe.objects.bulk_create(
+        [
+            Swipe(
+                swiper_id=swiper_id,
+                swipee_id=swipee_id,
+                event_id=event_id,
+                direction=direction,
+            )
+            for swipee_id, direction in swipes
+        ],
+        ignore_conflicts=True,
+    )
+    consume_candidates(swiper_id, event_id, swipes)
+
+    # The squads in the batch that we and they swiped right on, as the
+    # swipes now stand, and that we hadn't matched with yet.
+    ours = Swipe.objects.filter(
+        swiper=swiper_id, swipee=OuterRef("swiper"), event=event_id, direction=True
+    )
+    matched = Match.objects.filter(
+        Q(squad_1=swiper_id, squad_2=OuterRef("swiper"))
+        | Q(squad_1=OuterRef("swiper"), squad_2=swiper_id),
+        event=event_id,
+    )
+    new = (
+        Swipe.objects.filter(
+            swiper__in=[swipee_id for swipee_id, direction in swipes if direction],
+            swipee=swiper_id,
+            event=event_id,
+            direction=True,
+        )
+        .annotate(ours=Exists(ours), matched=Exists(matched))
+        .filter(ours=True, matched=False)
+        .values_list("swiper", flat=True)
+    )
+    new = sorted(new)
+    Match.objects.bulk_create(
+        [make_match(swiper_id, squad_id, event_id) for squad_id in new],
+        ignore_conflicts=True,
+    )
+    return new
+
+
+def sync_matches(squad=None):
+    # Writes a Match for every pair of mutual right swipes, for one squad or
+    # for everybody. Matches that already exist are left alone. Returns how
+    # many mutual pairs were found.
+    mutual = Swipe.objects.filter(
+        swiper=OuterRef("swipee"),
+        swipee=OuterRef("swiper"),
+        event=OuterRef("event"),
+        direction=True,
+    )
+    swipes = Swipe.objects.filter(direction=True, swiper__lt=F("swipee"))
+    if squad is not None:
+        swipes = swipes.filter(Q(swiper=squad) | Q(swipee=squad))
+    pairs = (
+        swipes.annotate(mutual=Exists(mutual))
+        .filter(mutual=True)
+        .values_list("swiper", "swipee", "event")
+    )
+
+    found, batch = 0, []
+    for swiper_id, swipee_id, event_id in pairs.iterator():
+        batch.append(make_match(swiper_id, swipee_id, event_id))
+        found += 1
+        if len(batch) == MATCH_BATCH_SIZE:
+            Match.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Match.objects.bulk_create(batch, ignore_conflicts=True)
+    return found
+
+
+def refresh_request_counts(squad_ids):
+    # Recounts the pending requests of the given squads with one UPDATE.
+    pending = (
+        Request.objects.filter(requestee=OuterRef("pk"))
+        .order_by()
+        .values("requestee")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    Squad.objects.filter(pk__in=squad_ids).update(
+        pending_requests=Coalesce(Subquery(pending, output_field=IntegerField()), 0)
+    )
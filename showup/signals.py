@@ -0,0 +1,24 @@
+from .avatars import invalidate_avatars
+from .models import Request
+from .services import refresh_request_counts
+from avatar.models import Avatar
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+# Keep Squad.pending_requests in step with the requests a squad receives.
+@receiver(post_save, sender=Request)
+def request_saved(sender, instance, **kwargs):
+    refresh_request_counts([instance.requestee_id])
+
+
+@receiver(post_delete, sender=Request)
+def request_deleted(sender, instance, **kwargs):
+    refresh_request_counts([instance.requestee_id])
+
+
+# Primed avatars are cached until a user's avatars change.
+@receiver(post_save, sender=Avatar)
+@receiver(post_delete, sender=Avatar)
+def avatar_changed(sender, instance, **kwargs):
+    invalidate_avatars(instance.user)
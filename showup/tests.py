@@ -1,12 +1,52 @@
 import datetime
-from dateutil.relativedelta import relativedelta
+import json
+import re
+import threading
 
-from .models import Concert, CustomUser, Genre, Request, Squad, Swipe
+from dateutil.relativedelta import relativedelta
+from importlib import import_module
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+
+from .models import (
+    CandidateQueue,
+    Concert,
+    CustomUser,
+    Genre,
+    Match,
+    QueuedCandidate,
+    Request,
+    Squad,
+    Swipe,
+    SyncCheckpoint,
+)
+from . import profiling, seatgeek, urls
 from allauth.account.admin import EmailAddress
-from django.test import Client, TestCase
-from django.urls import reverse
+from avatar.models import Avatar
+from avatar.templatetags import avatar_tags
+from avatar.utils import get_cache_key
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, resolve, reverse
 from django.utils.timezone import make_aware, utc
+from .avatars import prime_avatars
+from .facets import get_facets
+from .filters import ConcertFilter, encode_cursor
 from .forms import CustomUserForm
+from .ranking import rank_squads
+from .search import search_after, search_concerts
+from .queues import next_candidates
+from .services import GOING, INTERESTED, make_match, merge_squads, record_swipe
+from .services import set_attendance
+from .views import EVENTS_PAGE_SIZE
 
 
 class ConcertModelTests(TestCase):
@@ -145,6 +185,7 @@ class HomeViewLoggedInTests(TestCase):
 
         # Create and save event.
         Concert.objects.create(id=1, datetime=datetime.datetime.now(tz=utc))
+        self.tomorrow = datetime.datetime.now(tz=utc) + datetime.timedelta(days=1)
 
     def test_home_interested(self):
         # Mark event as "Going".
@@ -194,6 +235,38 @@ class HomeViewLoggedInTests(TestCase):
         num_going = CustomUser.objects.get(id=1).squad.interested.count()
         self.assertEqual(num_going, 0)
 
+    def test_home_lists_upcoming_events_with_genres(self):
+        past = datetime.datetime.now(tz=utc) - datetime.timedelta(days=2)
+        Concert.objects.create(id=2, datetime=past, performer_names="The Past")
+        Concert.objects.get(id=1).genres.add(Genre.objects.create(genre="ska"))
+        squad = Squad.objects.get(id=1)
+        squad.interested.add(1, 2)
+        squad.going.add(2)
+
+        response = self.client.get(reverse("home"))
+        self.assertEqual([e.id for e in response.context["interested"]], [1])
+        self.assertEqual(response.context["going"], [])
+        self.assertContains(response, "These are the 1 concerts I'm interested in.")
+        self.assertContains(response, "Genres: ska")
+        self.assertNotContains(response, "The Past")
+
+    def test_home_queries_dont_grow_with_the_events(self):
+        def count():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse("home"))
+            return len(queries)
+
+        squad = Squad.objects.get(id=1)
+        squad.interested.add(1)
+        squad.going.add(Concert.objects.create(id=2, datetime=self.tomorrow))
+        self.client.get(reverse("home"))
+        few = count()
+        for i in range(3, 7):
+            event = Concert.objects.create(id=i, datetime=self.tomorrow)
+            event.genres.add(Genre.objects.create(genre=f"genre {i}"))
+            (squad.interested if i % 2 else squad.going).add(event)
+        self.assertEqual(count(), few)
+
 
 class EventsViewTests(TestCase):
     def setUp(self):
@@ -236,13 +309,82 @@ class EventsViewTests(TestCase):
         self.assertEqual(num_going, 0)
 
     def test_events_going_not_going(self):
-        # if you mark yourself as going twice, you won't be going to the
-        # event because the second one undoes the first one
-        self.client.post(reverse("events"), data={"going": 1})
+        # if you mark yourself as going twice, like with a double click,
+        # you're still going. The highlighted "Going" button undoes it.
         self.client.post(reverse("events"), data={"going": 1})
+        response = self.client.post(reverse("events"), data={"going": 1})
+        num_going = CustomUser.objects.get(id=1).squad.going.count()
+        self.assertEqual(num_going, 1)
+        self.assertContains(response, 'name="not_going" value=1>')
+
+        self.client.post(reverse("events"), data={"not_going": 1})
         num_going = CustomUser.objects.get(id=1).squad.going.count()
         self.assertEqual(num_going, 0)
 
+    def test_events_flag_interested_and_going_concerts(self):
+        self.make_events(3)
+        squad = CustomUser.objects.get(id=1).squad
+        squad.going.add(3)
+
+        # The flags already show the click.
+        response = self.client.post(reverse("events"), data={"interested": 2})
+        flags = {
+            event.id: (event.is_interested, event.is_going)
+            for event in response.context["page"]
+        }
+        self.assertEqual(
+            flags,
+            {1: (False, False), 2: (True, False), 3: (False, True), 4: (False, False)},
+        )
+
+    def test_events_flags_come_with_the_page(self):
+        self.make_events(3)
+        CustomUser.objects.get(id=1).squad.interested.add(2, 3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("events"))
+        self.assertContains(
+            response, 'btn-primary" type="submit" name="not_interested"', 2
+        )
+        self.assertEqual(sum("showup_squad_interested" in q["sql"] for q in queries), 1)
+
+    def make_events(self, count):
+        # Pairs of events at the same time, so the id has to break ties.
+        start = datetime.datetime.now(tz=utc)
+        Concert.objects.bulk_create(
+            Concert(id=i, datetime=start + datetime.timedelta(hours=i // 2))
+            for i in range(2, count + 2)
+        )
+
+    def test_events_pages_cover_every_event_once(self):
+        self.make_events(EVENTS_PAGE_SIZE * 2)
+        seen, url = [], reverse("events") + "?borough=BK&borough=MN"
+        Concert.objects.update(borough="BK")
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.context["page"]), EVENTS_PAGE_SIZE)
+            seen += [event.id for event in response.context["page"]]
+            next_page = response.context["next_page"]
+            url = next_page and reverse("events") + "?" + next_page
+            if next_page:
+                self.assertEqual(parse_qs(next_page)["borough"], ["BK", "MN"])
+        self.assertEqual(seen, list(range(1, EVENTS_PAGE_SIZE * 2 + 2)))
+
+    def test_events_deep_pages_skip_no_rows(self):
+        self.make_events(EVENTS_PAGE_SIZE * 3)
+        response = self.client.get(reverse("events"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("events") + "?" + response.context["next_page"]
+            )
+        self.assertEqual(response.context["page"][0].id, EVENTS_PAGE_SIZE + 1)
+        self.assertFalse(any("OFFSET" in q["sql"] for q in queries))
+
+    def test_events_bad_cursor_shows_the_first_page(self):
+        response = self.client.get(reverse("events") + "?after=nonsense")
+        self.assertEqual([event.id for event in response.context["page"]], [1])
+        self.assertEqual(response.context["first_page"], "")
+        self.assertIsNone(response.context["next_page"])
+
 
 class UserViewTests(TestCase):
     def setUp(self):
@@ -506,11 +648,40 @@ class MatchesViewTests(TestCase):
         Swipe.objects.create(
             swiper=squad_2, swipee=squad_1, event=event, direction=direction
         )
+        call_command("backfill_matches", stdout=StringIO())
 
     def test_matches_basic(self):
         response = self.client.get(reverse("matches"))
         self.assertEqual(response.status_code, 200)
 
+    def test_matches_lists_the_other_squad(self):
+        response = self.client.get(reverse("matches"))
+        self.assertEqual([m.other_id for m in response.context["matches"]], [2])
+        self.assertEqual([e.id for e in response.context["events"]], [1])
+
+    def test_matches_group_users_by_squad(self):
+        response = self.client.get(reverse("matches"))
+        [(match, members)] = list(response.context["events"].values())[0]
+        self.assertEqual(match.other_id, 2)
+        self.assertEqual([u.email for u in members], ["jfallon@example.com"])
+
+    def test_backfill_matches_is_idempotent(self):
+        call_command("backfill_matches", stdout=StringIO())
+        match = Match.objects.get()
+        self.assertEqual(str(match), "Squad 1: 1, Squad 2: 2, Event: 1")
+
+    def test_match_migration_backfills_matches(self):
+        Match.objects.all().delete()
+        Squad.objects.create(id=3)
+        Swipe.objects.create(swiper_id=1, swipee_id=3, event_id=1, direction=True)
+        Swipe.objects.create(swiper_id=3, swipee_id=1, event_id=1, direction=False)
+
+        migration = import_module("showup.migrations.0008_match")
+        migration.backfill_matches(apps, None)
+        self.assertEqual(
+            list(Match.objects.values_list("squad_1", "squad_2", "event")), [(1, 2, 1)]
+        )
+
     def test_authed_user_can_see_messages(self):
         self.response = self.client.get(reverse("messages", args=(1, 2)))
         self.assertEqual(
@@ -619,6 +790,11 @@ class RequestsViewTests(TestCase):
 
         self.response = self.client.get(reverse("requests"))
         self.assertEqual(self.response.status_code, 200)
+        squads = self.response.context["squads"]
+        self.assertEqual(
+            {squad.id: [u.email for u in users] for squad, users in squads.items()},
+            {1: ["jspringer@example.com"], 2: ["jfallon@example.com"]},
+        )
 
     def test_requests_accept(self):
         # Create the request.
@@ -635,6 +811,19 @@ class RequestsViewTests(TestCase):
         squad_size = CustomUser.objects.filter(squad=squad_1).count()
         self.assertEqual(squad_size, 2)
 
+    def test_requests_accept_keeps_the_request_if_the_merge_fails(self):
+        squad_1 = Squad.objects.get(id=1)
+        squad_3 = Squad.objects.get(id=3)
+        Request.objects.create(requester=squad_1, requestee=squad_3)
+
+        data = {"accept": "", "their_sid": 1}
+        with mock.patch("showup.services.sync_matches", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.post(reverse("requests"), data=data)
+
+        self.assertTrue(Request.objects.filter(requester=1, requestee=3).exists())
+        self.assertEqual(CustomUser.objects.filter(squad=squad_1).count(), 1)
+
     def test_requests_deny(self):
         # Create the request.
         squad_1 = Squad.objects.get(id=1)
@@ -775,6 +964,68 @@ class EventStackViewTests(TestCase):
         expected_output = "Swiper: 3, Swipee: 1, Event: 1, Direction: True"
         self.assertEqual(swipe.__str__(), expected_output)
 
+    def test_eventstack_second_right_swipe_creates_match(self):
+        e = Concert.objects.create(id=1, datetime=datetime.datetime.now(tz=utc))
+        Swipe.objects.create(event=e, swiper_id=1, swipee_id=3, direction=True)
+
+        data = {"their_sid": 1, "match": "True"}
+        response = self.client.post(reverse("event_stack", kwargs={"eid": 1}), data)
+
+        self.assertEqual(response.context["match"].id, 1)
+        match = Match.objects.get()
+        self.assertEqual((match.squad_1_id, match.squad_2_id), (1, 3))
+
+    def test_eventstack_double_swipe(self):
+        e = Concert.objects.create(id=1, datetime=datetime.datetime.now(tz=utc))
+        Swipe.objects.create(event=e, swiper_id=1, swipee_id=3, direction=True)
+
+        data = {"their_sid": 1, "match": "True"}
+        self.client.post(reverse("event_stack", kwargs={"eid": 1}), data)
+        response = self.client.post(reverse("event_stack", kwargs={"eid": 1}), data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Swipe.objects.filter(swiper_id=3).count(), 1)
+        self.assertEqual(Match.objects.count(), 1)
+
+    def test_eventstack_excludes_swiped_squads(self):
+        e = Concert.objects.create(id=1, datetime=datetime.datetime.now(tz=utc))
+        squads = [Squad.objects.create(id=i) for i in range(4, 7)]
+        Squad.objects.get(id=1).interested.add(e)
+        Squad.objects.get(id=2).going.add(e)
+        Squad.objects.get(id=3).interested.add(e)
+        for squad in squads:
+            squad.interested.add(e)
+
+        # Squad 4 swiped left on us, squad 5 swiped right on us and we
+        # already swiped on squad 6.
+        Swipe.objects.create(event=e, swiper_id=4, swipee_id=3, direction=False)
+        Swipe.objects.create(event=e, swiper_id=5, swipee_id=3, direction=True)
+        Swipe.objects.create(event=e, swiper_id=3, swipee_id=6, direction=True)
+
+        # The page shows the top of the stack.
+        response = self.client.get(reverse("event_stack", kwargs={"eid": 1}))
+        self.assertEqual([s.id for s in response.context["squads"]], [1])
+        self.assertEqual([s.id for s in next_candidates(3, 1, 10)], [1, 2, 5])
+
+    def test_eventstack_query_count_does_not_grow_with_stack(self):
+        e = Concert.objects.create(id=1, datetime=datetime.datetime.now(tz=utc))
+        Squad.objects.get(id=1).interested.add(e)
+
+        def count_queries():
+            self.client.get(reverse("event_stack", kwargs={"eid": 1}))
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse("event_stack", kwargs={"eid": 1}))
+            return len(queries)
+
+        few = count_queries()
+        for i in range(20):
+            squad = Squad.objects.create()
+            squad.going.add(e)
+            CustomUser.objects.create(
+                username=f"{i}", email=f"{i}@example.com", squad=squad
+            )
+        self.assertEqual(few, count_queries())
+
 
 class AuthenticatedViewTests(TestCase):
     def setUp(self):  # this logs in a test user for the subsequent test cases
@@ -895,3 +1146,1178 @@ class CustomUserFormTests(TestCase):
         }
         form = CustomUserForm(data=data)
         self.assertTrue(form.is_valid())
+
+
+def make_seatgeek_event(
+    id, performer="Team Debug Entities", genres=(), venue="Rogers Hall"
+):
+    genre_list = [{"name": g} for g in genres]
+    return {
+        "id": id,
+        "datetime_local": "2019-12-31T20:00:00",
+        "url": f"https://seatgeek.com/{id}",
+        "venue": {"name_v2": venue},
+        "performers": [{"name": performer, "image": None, "genres": genre_list}],
+    }
+
+
+class SeatGeekStub(ThreadingMixIn, HTTPServer):
+    # A local stand-in for api.seatgeek.com. `events` maps a borough to the
+    # events it returns and `failures` to how many 503s it sends first.
+    daemon_threads = True
+
+    def __init__(self, events, failures=None):
+        super().__init__(("127.0.0.1", 0), SeatGeekStubHandler)
+        self.events = events
+        self.failures = dict(failures or {})
+        self.hits = []
+        self.params = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/2/events"
+
+
+class SeatGeekStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        borough = {location["lat"]: b for b, location in seatgeek.BOROUGHS}[
+            params["lat"][0]
+        ]
+        page, per_page = int(params["page"][0]), int(params["per_page"][0])
+        with self.server.lock:
+            self.server.hits.append((borough, page))
+            self.server.params.append(params)
+            failing = self.server.failures.get(borough, 0) > 0
+            if failing:
+                self.server.failures[borough] -= 1
+
+        if failing:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        events = self.server.events.get(borough, [])
+        start = (page - 1) * per_page
+        body = json.dumps(
+            {
+                "events": events[start:][:per_page],
+                "meta": {"page": page, "per_page": per_page, "total": len(events)},
+            }
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class PullSeatGeekDataTests(TestCase):
+    def serve(self, events, failures=None):
+        stub = SeatGeekStub(events, failures)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        self.addCleanup(stub.server_close)
+        self.addCleanup(stub.shutdown)
+        return stub
+
+    def pull(self, stub, **options):
+        options.setdefault("stdout", StringIO())
+        call_command("pull_seatgeek_data", base_url=stub.url, backoff=0, **options)
+
+    def test_pull_assigns_boroughs_in_priority_order(self):
+        # Event 1 falls inside both the Brooklyn and the Manhattan circles.
+        stub = self.serve(
+            {
+                "BK": [make_seatgeek_event(1, genres=["rock"])],
+                "MN": [
+                    make_seatgeek_event(1, genres=["rock"]),
+                    make_seatgeek_event(2),
+                ],
+            }
+        )
+        self.pull(stub)
+
+        self.assertEqual(
+            sorted(stub.hits), sorted((b, 1) for b, _ in seatgeek.BOROUGHS)
+        )
+        self.assertEqual(Concert.objects.get(id=1).borough, "BK")
+        self.assertEqual(Concert.objects.get(id=2).borough, "MN")
+        self.assertEqual(Concert.objects.get(id=1).genres.get().genre, "rock")
+
+    def test_pull_retries_server_errors(self):
+        stub = self.serve({"QN": [make_seatgeek_event(1)]}, failures={"QN": 2})
+        self.pull(stub)
+
+        self.assertEqual(stub.hits.count(("QN", 1)), 3)
+        self.assertEqual(Concert.objects.get(id=1).borough, "QN")
+
+    def test_pull_follows_every_page(self):
+        stub = self.serve(
+            {
+                "BK": [make_seatgeek_event(i) for i in range(1, 24)],
+                "MN": [make_seatgeek_event(i) for i in range(20, 30)],
+            }
+        )
+        self.pull(stub, per_page=5, workers=2)
+
+        self.assertEqual(sorted(p for b, p in stub.hits if b == "BK"), [1, 2, 3, 4, 5])
+        self.assertEqual(sorted(p for b, p in stub.hits if b == "MN"), [1, 2])
+        self.assertEqual(Concert.objects.filter(borough="BK").count(), 23)
+        self.assertEqual(Concert.objects.filter(borough="MN").count(), 6)
+
+    def test_pull_records_a_checkpoint_per_borough(self):
+        stub = self.serve({"BK": [make_seatgeek_event(1)]})
+        out = StringIO()
+        call_command("pull_seatgeek_data", base_url=stub.url, backoff=0, stdout=out)
+        call_command("pull_seatgeek_data", base_url=stub.url, backoff=0, stdout=out)
+
+        checkpoint = SyncCheckpoint.objects.get(borough="BK")
+        self.assertEqual((checkpoint.inserted, checkpoint.unchanged), (0, 1))
+        self.assertEqual(SyncCheckpoint.objects.count(), len(seatgeek.BOROUGHS))
+        self.assertIn("BK: 1 inserted", out.getvalue())
+        self.assertIn("BK: 0 inserted", out.getvalue())
+
+    def test_pull_asks_only_for_events_before_the_horizon(self):
+        stub = self.serve({})
+        self.pull(stub, horizon_days=30)
+        self.assertTrue(all("datetime_utc.lte" in p for p in stub.params))
+
+        stub = self.serve({})
+        self.pull(stub, horizon_days=0)
+        self.assertFalse(any("datetime_utc.lte" in p for p in stub.params))
+
+
+class SaveConcertsTests(TestCase):
+    def count_queries(self, concert_list):
+        with CaptureQueriesContext(connection) as queries:
+            seatgeek.save_concerts(concert_list, "BK")
+        return len(queries)
+
+    def test_save_concerts_query_count_does_not_grow_with_page(self):
+        small_page = [make_seatgeek_event(1, genres=["rock"])]
+        big_page = [
+            make_seatgeek_event(i, genres=[f"genre {i}", f"genre {i + 1}"])
+            for i in range(2, 40)
+        ]
+        self.assertEqual(self.count_queries(small_page), self.count_queries(big_page))
+        self.assertEqual(Concert.objects.count(), 39)
+        self.assertEqual(Concert.objects.get(id=2).genres.count(), 2)
+
+        # Sending everything again, with changes, costs no more either.
+        small_page = [make_seatgeek_event(1, genres=["jazz"], venue="Elsewhere")]
+        big_page = [
+            make_seatgeek_event(i, genres=["jazz"], venue="Elsewhere")
+            for i in range(2, 40)
+        ]
+        self.assertEqual(self.count_queries(small_page), self.count_queries(big_page))
+
+    def test_save_concerts_updates_only_changed_concerts(self):
+        seatgeek.save_concerts(
+            [make_seatgeek_event(1, genres=["rock"]), make_seatgeek_event(2)], "BK"
+        )
+        counts, _ = seatgeek.save_concerts(
+            [
+                make_seatgeek_event(1, genres=["jazz"], venue="Elsewhere"),
+                make_seatgeek_event(2),
+            ],
+            "MN",
+        )
+
+        self.assertEqual(counts, {"inserted": 0, "updated": 1, "unchanged": 1})
+        concert = Concert.objects.get(id=1)
+        self.assertEqual(concert.venue_name, "Elsewhere")
+        self.assertEqual(concert.borough, "BK")
+        self.assertEqual([g.genre for g in concert.genres.all()], ["jazz"])
+
+    def test_save_concerts_skips_writes_for_unchanged_concerts(self):
+        page = [make_seatgeek_event(i, genres=["rock"]) for i in range(1, 10)]
+        seatgeek.save_concerts(page, "BK")
+
+        with CaptureQueriesContext(connection) as queries:
+            counts, _ = seatgeek.save_concerts(page, "BK")
+        self.assertEqual(counts, {"inserted": 0, "updated": 0, "unchanged": 9})
+        writes = [q for q in queries if q["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertEqual(writes, [])
+
+
+class MergeSquadsTests(TestCase):
+    def setUp(self):
+        self.winner = Squad.objects.create(id=1)
+        self.loser = Squad.objects.create(id=2)
+        self.other = Squad.objects.create(id=3)
+        self.events = [
+            Concert.objects.create(id=i, datetime=datetime.datetime.now(tz=utc))
+            for i in range(1, 5)
+        ]
+
+    def add_members(self, squad, count):
+        for i in range(count):
+            CustomUser.objects.create(
+                username=f"{squad.id}-{i}",
+                email=f"{squad.id}-{i}@example.com",
+                squad=squad,
+            )
+
+    def test_merge_squads_moves_members_and_events(self):
+        self.add_members(self.winner, 1)
+        self.add_members(self.loser, 2)
+        e1, e2, e3, e4 = self.events
+        self.winner.interested.add(e1)
+        self.winner.going.add(e2)
+        self.loser.going.add(e1)
+        self.loser.interested.add(e2, e3)
+        self.loser.going.add(e4)
+
+        merge_squads(self.winner, self.loser)
+
+        self.assertFalse(Squad.objects.filter(id=2).exists())
+        self.assertEqual(CustomUser.objects.filter(squad=self.winner).count(), 3)
+        self.assertEqual(
+            sorted(self.winner.interested.values_list("id", flat=True)), [3]
+        )
+        self.assertEqual(
+            sorted(self.winner.going.values_list("id", flat=True)), [1, 2, 4]
+        )
+
+    def test_merge_squads_repoints_swipes_and_requests(self):
+        e1, e2 = self.events[:2]
+        Swipe.objects.create(
+            swiper=self.loser, swipee=self.other, event=e1, direction=True
+        )
+        Swipe.objects.create(
+            swiper=self.winner, swipee=self.other, event=e2, direction=False
+        )
+        Swipe.objects.create(
+            swiper=self.loser, swipee=self.other, event=e2, direction=True
+        )
+        Swipe.objects.create(
+            swiper=self.other, swipee=self.loser, event=e1, direction=True
+        )
+        Swipe.objects.create(
+            swiper=self.winner, swipee=self.loser, event=e1, direction=True
+        )
+        Request.objects.create(requester=self.other, requestee=self.loser)
+        Request.objects.create(requester=self.loser, requestee=self.winner)
+
+        merge_squads(self.winner, self.loser)
+
+        swipes = sorted(
+            (s.swiper_id, s.swipee_id, s.event_id, s.direction)
+            for s in Swipe.objects.all()
+        )
+        self.assertEqual(swipes, [(1, 3, 1, True), (1, 3, 2, False), (3, 1, 1, True)])
+        requests = [(r.requester_id, r.requestee_id) for r in Request.objects.all()]
+        self.assertEqual(requests, [(3, 1)])
+        matches = [
+            (m.squad_1_id, m.squad_2_id, m.event_id) for m in Match.objects.all()
+        ]
+        self.assertEqual(matches, [(1, 3, 1)])
+
+    def test_merge_squads_query_count_does_not_grow_with_squads(self):
+        def count_queries(members, events):
+            winner, loser = Squad.objects.create(), Squad.objects.create()
+            self.add_members(loser, members)
+            loser.interested.add(*events)
+            loser.going.add(*events[: len(events) // 2])
+            with CaptureQueriesContext(connection) as queries:
+                merge_squads(winner, loser)
+            return len(queries)
+
+        self.assertEqual(
+            count_queries(1, self.events[:1]), count_queries(4, self.events)
+        )
+
+
+# A plan step that reads a whole showup table without an index.
+FULL_SCAN = re.compile(r"^SCAN (TABLE )?showup_\w+( AS \w+)?$")
+
+
+def query_plan(sql, params=()):
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite only.")
+class QueryPlanTests(TestCase):
+    # Fails when one of the queries our hot views depend on regresses to a
+    # full table scan. The plans are SQLite's, which is what CI runs.
+    def setUp(self):
+        email, password = "jspringer@example.com", "heyhey123"
+        squad_1 = Squad.objects.create(id=1)
+        user = CustomUser.objects.create_user(
+            username=email, email=email, password=password, squad=squad_1
+        )
+        EmailAddress.objects.create(id=1, user=user, verified=True)
+        self.client.login(username=email, password=password)
+
+        squad_2 = Squad.objects.create(id=2)
+        CustomUser.objects.create_user(
+            username="jfallon@example.com", email="jfallon@example.com", squad=squad_2
+        )
+        event = Concert.objects.create(id=1, datetime=datetime.datetime.now(tz=utc))
+        squad_2.interested.add(event)
+        Swipe.objects.create(
+            swiper=squad_2, swipee=squad_1, event=event, direction=True
+        )
+        Request.objects.create(requester=squad_2, requestee=squad_1)
+
+    def assertUsesIndexes(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        plan = query_plan(sql, params)
+        self.assertEqual([d for d in plan if FULL_SCAN.match(d)], [], sql)
+
+    def assertViewUsesIndexes(self, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            if data is None:
+                self.client.get(url)
+            else:
+                self.client.post(url, data)
+        for query in queries:
+            if query["sql"].startswith("SELECT"):
+                plan = query_plan(query["sql"])
+                self.assertEqual(
+                    [d for d in plan if FULL_SCAN.match(d)], [], query["sql"]
+                )
+
+    def test_hot_queries_use_indexes(self):
+        self.assertUsesIndexes(
+            Concert.objects.filter(borough="BK").order_by("datetime")
+        )
+        self.assertUsesIndexes(Concert.objects.filter(venue_name="Rogers Hall"))
+        self.assertUsesIndexes(Concert.objects.filter(performer_names="Phish"))
+        self.assertUsesIndexes(Concert.objects.order_by("datetime", "id")[:20])
+        self.assertUsesIndexes(Swipe.objects.filter(swipee=1, event=1, direction=False))
+        self.assertUsesIndexes(Swipe.objects.filter(swiper=1, event=1))
+        self.assertUsesIndexes(Swipe.objects.filter(swiper=1, direction=True))
+        self.assertUsesIndexes(Swipe.objects.filter(swipee=1, direction=True))
+
+    def test_hot_views_use_indexes(self):
+        self.assertViewUsesIndexes(reverse("home"))
+        self.assertViewUsesIndexes(reverse("event_stack", args=(1,)))
+        self.assertViewUsesIndexes(
+            reverse("event_stack", args=(1,)), {"their_sid": 2, "match": "True"}
+        )
+        self.assertViewUsesIndexes(reverse("matches"))
+        self.assertViewUsesIndexes(reverse("messages", args=(1, 2)))
+        self.assertViewUsesIndexes(reverse("requests"))
+        self.assertViewUsesIndexes(reverse("squad", args=(1,)))
+
+    def test_events_filters_use_indexes(self):
+        # The facets are cached, so only the first render computes them.
+        self.client.get(reverse("events"))
+        self.assertViewUsesIndexes(reverse("events"))
+        self.assertViewUsesIndexes(reverse("events") + "?venues=Rogers+Hall")
+        cursor = encode_cursor(Concert.objects.first())
+        self.assertViewUsesIndexes(reverse("events") + "?after=" + cursor)
+        self.assertViewUsesIndexes(reverse("events") + "?search=rogers+hall")
+
+
+class FacetsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        rock, jazz = (
+            Genre.objects.create(genre="rock"),
+            Genre.objects.create(genre="jazz"),
+        )
+        now = datetime.datetime.now(tz=utc)
+        for i, (venue, performer, borough) in enumerate(
+            [
+                ("Rogers Hall", "Phish", "BK"),
+                ("Rogers Hall", "Phish", "BK"),
+                ("Elsewhere", "Lizzo", "MN"),
+            ]
+        ):
+            concert = Concert.objects.create(
+                id=i,
+                datetime=now,
+                venue_name=venue,
+                performer_names=performer,
+                borough=borough,
+            )
+            concert.genres.add(rock)
+        concert.genres.add(jazz)
+
+    def test_facets_count_every_value(self):
+        facets = get_facets()
+        self.assertEqual(facets["venues"], [("Elsewhere", 1), ("Rogers Hall", 2)])
+        self.assertEqual(facets["performers"], [("Lizzo", 1), ("Phish", 2)])
+        self.assertEqual(facets["genres"], [("jazz", 1), ("rock", 3)])
+        self.assertEqual(
+            facets["boroughs"][:2], [("BK", "Brooklyn", 2), ("MN", "Manhattan", 1)]
+        )
+
+    def test_facets_are_cached_until_the_next_sync(self):
+        get_facets()
+        with CaptureQueriesContext(connection) as queries:
+            get_facets()
+        self.assertEqual(len(queries), 1)
+
+        Concert.objects.filter(venue_name="Elsewhere").delete()
+        SyncCheckpoint.objects.create(
+            borough="MN", synced_at=datetime.datetime.now(tz=utc)
+        )
+        self.assertEqual(get_facets()["venues"], [("Rogers Hall", 2)])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        seatgeek.save_concerts(
+            [
+                make_seatgeek_event(1, performer="Phish", genres=["jam band"]),
+                make_seatgeek_event(2, performer="Lizzo", venue="Phish Arena"),
+                make_seatgeek_event(3, performer="Blue Note", genres=["phish rock"]),
+                make_seatgeek_event(4, performer="Björk", venue="Elsewhere"),
+            ],
+            "BK",
+        )
+
+    def search(self, query, after=None):
+        data = {"search": query}
+        if after:
+            data["after"] = after
+        queryset = Concert.objects.order_by("datetime", "id")
+        return list(ConcertFilter(data, queryset=queryset).qs)
+
+    def test_search_ranks_performers_over_venues_over_genres(self):
+        self.assertEqual([c.id for c in self.search("phish")], [1, 2, 3])
+        self.assertEqual([c.id for c in self.search("jam")], [1])
+        self.assertEqual([c.id for c in self.search("ELSEW bjork")], [4])
+
+    def test_search_ignores_query_syntax(self):
+        self.assertEqual(self.search('phish" *) ('), self.search("phish"))
+        self.assertEqual(len(self.search("!!")), 4)
+
+    def test_search_pages_follow_the_rank(self):
+        first, *rest = self.search("phish")
+        self.assertEqual(self.search("phish", encode_cursor(first)), rest)
+
+    def test_search_index_follows_ingestion(self):
+        seatgeek.save_concerts([make_seatgeek_event(1, performer="Trey")], "BK")
+        self.assertEqual([c.id for c in self.search("phish")], [2, 3])
+        self.assertEqual([c.id for c in self.search("trey")], [1])
+
+        call_command("delete_all_concert_data")
+        seatgeek.save_concerts([make_seatgeek_event(5)], "BK")
+        self.assertEqual([c.id for c in self.search("rogers")], [5])
+
+
+@skipUnless(connection.vendor == "postgresql", "The tsvector index is Postgres only.")
+class PostgresSearchTests(TransactionTestCase):
+    # A TransactionTestCase, since it truncates the tables after each test,
+    # which the search table mustn't get in the way of.
+    def setUp(self):
+        seatgeek.save_concerts(
+            [
+                make_seatgeek_event(1, performer="Phish", genres=["jam band"]),
+                make_seatgeek_event(2, performer="Lizzo", venue="Phish Arena"),
+                make_seatgeek_event(3, performer="Blue Note", genres=["phish rock"]),
+            ],
+            "BK",
+        )
+
+    def test_search_concerts_and_search_after(self):
+        results = search_concerts(Concert.objects.all(), "phis")
+        first, *rest = results
+        self.assertEqual([first.id] + [c.id for c in rest], [1, 2, 3])
+        after = search_after(results, "phis", first.search_rank, first.id)
+        self.assertEqual([c.id for c in after], [2, 3])
+
+    def test_concerts_can_be_truncated(self):
+        call_command("flush", interactive=False, stdout=StringIO())
+        self.assertFalse(Concert.objects.exists())
+
+
+class PendingRequestsTests(TestCase):
+    def setUp(self):
+        email, password = "jspringer@example.com", "heyhey123"
+        self.squad = Squad.objects.create(id=1)
+        user = CustomUser.objects.create_user(
+            username=email, email=email, password=password, squad=self.squad
+        )
+        EmailAddress.objects.create(id=1, user=user, verified=True)
+        self.client.login(username=email, password=password)
+        self.others = [Squad.objects.create(id=i) for i in range(2, 5)]
+
+    def pending(self, squad):
+        return Squad.objects.get(id=squad.id).pending_requests
+
+    def test_pending_requests_follow_requests(self):
+        for other in self.others:
+            Request.objects.create(requester=other, requestee=self.squad)
+        self.assertEqual(self.pending(self.squad), 3)
+
+        Request.objects.filter(requester=self.others[0]).delete()
+        self.assertEqual(self.pending(self.squad), 2)
+
+        # Deleting a squad takes the requests it sent with it.
+        self.others[1].delete()
+        self.assertEqual(self.pending(self.squad), 1)
+
+    def test_pending_requests_follow_merges(self):
+        loser = self.others[0]
+        Request.objects.create(requester=self.others[1], requestee=loser)
+        Request.objects.create(requester=self.others[2], requestee=loser)
+        Request.objects.create(requester=self.others[2], requestee=self.squad)
+
+        merge_squads(self.squad, loser)
+
+        self.assertEqual(self.pending(self.squad), 2)
+
+    def test_badge_follows_answered_requests(self):
+        for other in self.others:
+            Request.objects.create(requester=other, requestee=self.squad)
+
+        data = {"deny": "", "their_sid": self.others[0].id}
+        response = self.client.post(reverse("requests"), data)
+        self.assertEqual(str(response.context["requests"]), "2")
+
+        data = {"accept": "", "their_sid": self.others[1].id}
+        response = self.client.post(reverse("requests"), data)
+        self.assertEqual(str(response.context["requests"]), "1")
+
+    def test_pages_read_the_counter_instead_of_counting(self):
+        Request.objects.create(requester=self.others[0], requestee=self.squad)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("home"))
+        self.assertContains(response, 'badge-danger" style')
+        self.assertEqual(str(response.context["requests"]), "1")
+        self.assertFalse(any("showup_request" in q["sql"] for q in queries))
+
+
+@override_settings(SHOWUP_PROFILING=True)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        profiling.stats.reset()
+        email, password = "jspringer@example.com", "heyhey123"
+        self.user = CustomUser.objects.create_user(
+            username=email, email=email, password=password, squad=Squad.objects.create()
+        )
+        EmailAddress.objects.create(id=1, user=self.user, verified=True)
+        self.client.login(username=email, password=password)
+
+    def test_server_timing_reports_the_queries(self):
+        CustomUser.objects.filter(id=self.user.id).update(is_staff=True)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("events"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r"^app;dur=[\d.]+, db;dur=[\d.]+;")
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn("sql-1;dur=", timing)
+        self.assertNotIn("\n", timing)
+
+    def test_server_timing_statements_are_for_staff_only(self):
+        timing = self.client.get(reverse("events"))["Server-Timing"]
+        self.assertRegex(timing, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+        with self.settings(DEBUG=True):
+            timing = self.client.get(reverse("events"))["Server-Timing"]
+        self.assertIn("sql-1;dur=", timing)
+
+    def test_expired_sessions_are_still_redirected(self):
+        self.client.get(reverse("events"))
+        session = self.client.session
+        session["_session_init_timestamp_"] -= settings.SESSION_EXPIRE_SECONDS + 1
+        session.save()
+        response = self.client.get(reverse("events"))
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn("sql-", response["Server-Timing"])
+
+    def test_stats_are_for_staff_only(self):
+        self.client.get(reverse("events"))
+        self.client.get(reverse("events"))
+        self.assertEqual(self.client.get(reverse("profiling")).status_code, 403)
+
+        CustomUser.objects.filter(id=self.user.id).update(is_staff=True)
+        stats = self.client.get(reverse("profiling")).json()
+        self.assertEqual(stats["events"]["requests"], 2)
+        self.assertEqual(sum(stats["events"]["histogram"].values()), 2)
+        self.assertLessEqual(len(stats["events"]["slowest"]), profiling.SLOWEST)
+
+    @override_settings(SHOWUP_PROFILING=False)
+    def test_profiling_is_opt_in(self):
+        response = self.client.get(reverse("events"))
+        self.assertFalse(response.has_header("Server-Timing"))
+        self.assertEqual(profiling.stats.snapshot(), {})
+
+
+class GenerateLoadDataTests(TestCase):
+    def generate(self, seed=0):
+        call_command(
+            "generate_load_data",
+            users=60,
+            concerts=20,
+            genres=5,
+            swipes=300,
+            seed=seed,
+            stdout=StringIO(),
+        )
+        return sorted(
+            Swipe.objects.values_list("swiper", "swipee", "event", "direction")
+        )
+
+    def test_generate_load_data_is_consistent(self):
+        self.generate()
+        self.assertEqual(CustomUser.objects.count(), 60)
+        self.assertEqual(Concert.objects.count(), 20)
+        self.assertFalse(CustomUser.objects.filter(squad=None).exists())
+        self.assertEqual(EmailAddress.objects.filter(verified=True).count(), 60)
+
+        # Squads only swipe on squads going to the same event, never on
+        # themselves, and the mutual right swipes are matches.
+        links = [Squad.interested.through, Squad.going.through]
+        attending = set().union(
+            *(link.objects.values_list("squad", "concert") for link in links)
+        )
+        for swiper, swipee, event in Swipe.objects.values_list(
+            "swiper", "swipee", "event"
+        ):
+            self.assertNotEqual(swiper, swipee)
+            self.assertIn((swiper, event), attending)
+            self.assertIn((swipee, event), attending)
+        right = set(
+            Swipe.objects.filter(direction=True).values_list(
+                "swiper", "swipee", "event"
+            )
+        )
+        mutual = [(a, b, e) for a, b, e in right if a < b and (b, a, e) in right]
+        self.assertEqual(Match.objects.count(), len(mutual))
+
+    def test_generate_load_data_is_seeded(self):
+        def regenerate(seed):
+            Squad.objects.all().delete()
+            Concert.objects.all().delete()
+            return self.generate(seed)
+
+        swipes = regenerate(seed=1)
+        self.assertEqual(regenerate(seed=1), swipes)
+        self.assertNotEqual(regenerate(seed=2), swipes)
+
+    def test_generated_users_can_log_in(self):
+        self.generate()
+        user = CustomUser.objects.order_by("id").first()
+        self.assertTrue(self.client.login(username=user.username, password="heyhey123"))
+        self.assertEqual(self.client.get(reverse("events")).status_code, 200)
+
+
+class QueryBudgetTests(TestCase):
+    # Every view declares a query budget with @query_budget. Each one is run
+    # against a small and a large squad, with as many events, matches,
+    # requests and other squads as it has members, and has to make the same
+    # number of queries for both, within its budget.
+    SIZES = (2, 6)
+
+    def setUp(self):
+        self.worlds = 0
+
+    def make_users(self, squad, count):
+        users = []
+        for _ in range(count):
+            self.worlds += 1
+            email = f"budget{self.worlds}@example.com"
+            user = CustomUser.objects.create(
+                username=email, email=email, first_name="Budget", squad=squad
+            )
+            EmailAddress.objects.create(user=user, email=email, verified=True)
+            users.append(user)
+        return users
+
+    def make_world(self, size):
+        squad = Squad.objects.create()
+        user, *_ = self.make_users(squad, size)
+        CustomUser.objects.filter(id=user.id).update(is_staff=True)
+        first = Concert.objects.count() + 1
+        events = [
+            Concert.objects.create(id=i, datetime=datetime.datetime.now(tz=utc))
+            for i in range(first, first + 2 * size)
+        ]
+        squad.interested.add(*events[:size])
+        squad.going.add(*events[size:])
+
+        others = []
+        for _ in range(size):
+            other = Squad.objects.create()
+            other_users = self.make_users(other, size)
+            other.interested.add(events[0])
+            Request.objects.create(requester=other, requestee=squad)
+            make_match(squad.id, other.id, events[0].id).save()
+            others.append(other)
+        return {
+            "user": user,
+            "squad": squad,
+            "events": events,
+            "others": others,
+            "stranger": other_users[0],
+        }
+
+    def count_queries(self, url, data=None, **post):
+        counts = []
+        for size in self.SIZES:
+            world = self.make_world(size)
+            self.client.force_login(world["user"])
+            path = url(world)
+            # Warm up, then empty the cache and the candidate queues so the
+            # count includes priming the avatars and building the queues.
+            self.client.get(path)
+            cache.clear()
+            CandidateQueue.objects.all().delete()
+            with CaptureQueriesContext(connection) as queries:
+                if data is None:
+                    response = self.client.get(path)
+                else:
+                    response = self.client.post(path, data(world), **post)
+            self.assertEqual(response.status_code, 200, path)
+            counts.append(len(queries))
+        return counts, resolve(path).func.query_budget
+
+    def assertWithinBudget(self, url, data=None, **post):
+        (small, large), budget = self.count_queries(url, data, **post)
+        self.assertEqual(small, large, "queries grow with the data")
+        self.assertLessEqual(large, budget, "over the view's query budget")
+
+    def test_every_view_has_a_budget(self):
+        for pattern in urls.urlpatterns:
+            if isinstance(pattern, URLPattern):
+                self.assertTrue(hasattr(pattern.callback, "query_budget"), pattern)
+
+    def test_home(self):
+        self.assertWithinBudget(lambda w: reverse("home"))
+        self.assertWithinBudget(
+            lambda w: reverse("home"),
+            lambda w: {"eid": w["events"][0].id, "going": ""},
+        )
+
+    def test_events(self):
+        self.assertWithinBudget(lambda w: reverse("events"))
+        self.assertWithinBudget(
+            lambda w: reverse("events"), lambda w: {"interested": w["events"][0].id}
+        )
+
+    def test_profiles(self):
+        self.assertWithinBudget(lambda w: reverse("user", args=(w["user"].id,)))
+        self.assertWithinBudget(lambda w: reverse("edit_profile", args=(w["user"].id,)))
+        self.assertWithinBudget(lambda w: reverse("settings"))
+
+    def test_squads(self):
+        self.assertWithinBudget(lambda w: reverse("squad", args=(w["squad"].id,)))
+        url = lambda w: reverse("edit_squad", args=(w["squad"].id,))  # noqa
+        self.assertWithinBudget(url)
+        self.assertWithinBudget(
+            url, lambda w: {"email": w["stranger"].email, "add": ""}
+        )
+
+    def test_requests(self):
+        self.assertWithinBudget(lambda w: reverse("requests"))
+        for answer in ("accept", "deny"):
+            self.assertWithinBudget(
+                lambda w: reverse("requests"),
+                lambda w: {"their_sid": w["others"][0].id, answer: ""},
+            )
+
+    def test_event_stack(self):
+        url = lambda w: reverse("event_stack", args=(w["events"][0].id,))  # noqa
+        self.assertWithinBudget(url)
+        self.assertWithinBudget(
+            url, lambda w: {"their_sid": w["others"][0].id, "match": "True"}
+        )
+
+    def test_swipes(self):
+        self.assertWithinBudget(
+            lambda w: reverse("swipes", args=(w["events"][0].id,)),
+            lambda w: {"swipes": [{"squad": o.id, "match": True} for o in w["others"]]},
+            content_type="application/json",
+        )
+
+    def test_matches(self):
+        self.assertWithinBudget(lambda w: reverse("matches"))
+        self.assertWithinBudget(
+            lambda w: reverse("messages", args=(w["squad"].id, w["others"][0].id))
+        )
+
+    def test_profiling(self):
+        self.assertWithinBudget(lambda w: reverse("profiling"))
+
+
+class AvatarTests(TestCase):
+    def setUp(self):
+        squad = Squad.objects.create()
+        self.users = [
+            CustomUser.objects.create(
+                username=f"user{i}@example.com",
+                email=f"user{i}@example.com",
+                squad=squad,
+            )
+            for i in range(3)
+        ]
+        # bulk_create skips django-avatar's signals, which make thumbnails.
+        Avatar.objects.bulk_create(
+            [
+                Avatar(user=self.users[0], avatar="avatars/old.jpg"),
+                Avatar(user=self.users[0], avatar="avatars/new.jpg", primary=True),
+            ]
+        )
+        self.avatar = Avatar.objects.get(primary=True)
+        cache.clear()
+
+    def test_priming_takes_one_query(self):
+        with self.assertNumQueries(1):
+            prime_avatars(self.users)
+        with self.assertNumQueries(0):
+            html = [avatar_tags.avatar(user) for user in self.users]
+        self.assertIn(self.avatar.avatar_url(80), html[0])
+        self.assertIn("gravatar.com", html[1])
+
+        # Users with nothing cached are the only ones looked up.
+        with self.assertNumQueries(0):
+            prime_avatars(self.users)
+
+    def test_primed_avatars_match_django_avatar(self):
+        prime_avatars(self.users[1:])
+        primed = [avatar_tags.avatar(user) for user in self.users[1:]]
+        cache.clear()
+        self.assertEqual(primed, [avatar_tags.avatar(user) for user in self.users[1:]])
+
+    def test_changing_an_avatar_invalidates_it(self):
+        prime_avatars(self.users)
+        key = get_cache_key(self.users[0], 80, "avatar")
+        self.assertIsNotNone(cache.get(key))
+        self.avatar.delete()
+        self.assertIsNone(cache.get(key))
+
+
+class RankingTests(TestCase):
+    def setUp(self):
+        self.rock, self.jazz, self.folk = [
+            Genre.objects.create(genre=genre) for genre in ("rock", "jazz", "folk")
+        ]
+        self.event, self.other_event = [
+            Concert.objects.create(id=i, datetime=datetime.datetime.now(tz=utc))
+            for i in (1, 2)
+        ]
+        self.squad = self.make_squad(1, [self.rock, self.jazz])
+
+    def make_squad(self, size, genres, events=()):
+        squad = Squad.objects.create()
+        squad.interested.add(self.event, *events)
+        for i in range(size):
+            user = CustomUser.objects.create(
+                username=f"{squad.id}-{i}",
+                email=f"{squad.id}-{i}@example.com",
+                squad=squad,
+            )
+            user.genres.set(genres)
+        return squad
+
+    def rank(self):
+        return rank_squads(self.squad.id, Squad.objects.exclude(id=self.squad.id))
+
+    def test_squads_that_like_our_genres_come_first(self):
+        folk = self.make_squad(1, [self.folk])
+        rock = self.make_squad(1, [self.rock])
+        both = self.make_squad(1, [self.jazz, self.rock])
+        self.assertEqual(self.rank(), [both.id, rock.id, folk.id])
+
+    def test_squads_going_to_our_events_and_our_size_come_first(self):
+        self.squad.going.add(self.other_event)
+        big = self.make_squad(4, [], [self.other_event])
+        small = self.make_squad(1, [])
+        same = self.make_squad(1, [], [self.other_event])
+        self.assertEqual(self.rank(), [same.id, big.id, small.id])
+
+    def test_ties_are_broken_by_id(self):
+        squads = [self.make_squad(1, [self.folk]).id for _ in range(3)]
+        self.assertEqual(self.rank(), squads)
+        self.assertEqual(rank_squads(self.squad.id, Squad.objects.none()), [])
+
+    def test_ranking_takes_the_same_queries_for_many_squads(self):
+        self.make_squad(2, [self.rock])
+        with CaptureQueriesContext(connection) as few:
+            self.rank()
+        for _ in range(20):
+            self.make_squad(3, [self.jazz, self.folk], [self.other_event])
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(len(self.rank()), 21)
+        self.assertEqual(len(few), len(many))
+
+
+class CandidateQueueTests(TestCase):
+    def setUp(self):
+        self.event = Concert.objects.create(
+            id=1, datetime=datetime.datetime.now(tz=utc)
+        )
+        self.squads = [Squad.objects.create(id=i) for i in range(1, 5)]
+        for squad in self.squads:
+            squad.interested.add(self.event)
+        email, password = "jspringer@example.com", "heyhey123"
+        user = CustomUser.objects.create_user(
+            username=email, email=email, password=password, squad=self.squads[0]
+        )
+        EmailAddress.objects.create(id=1, user=user, verified=True)
+        self.client.login(username=email, password=password)
+        self.url = reverse("event_stack", kwargs={"eid": 1})
+
+    def stack(self):
+        # The page shows the first squad of the stack. The rest are queued.
+        squads = self.client.get(self.url).context["squads"]
+        stack = [s.id for s in next_candidates(1, 1, 10)]
+        self.assertEqual([s.id for s in squads], stack[:1])
+        return stack
+
+    def queued(self, squad):
+        return list(
+            QueuedCandidate.objects.filter(queue__squad=squad)
+            .order_by("rank")
+            .values_list("candidate", flat=True)
+        )
+
+    def test_queue_is_built_on_the_first_visit_only(self):
+        self.assertFalse(CandidateQueue.objects.exists())
+        self.assertEqual(self.stack(), [2, 3, 4])
+        self.assertEqual(self.queued(1), [2, 3, 4])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.stack(), [2, 3, 4])
+        self.assertFalse(any("showup_customuser_genres" in q["sql"] for q in queries))
+
+    def test_swipes_consume_the_queues(self):
+        self.stack()
+        record_swipe(1, 2, 1, True)
+        self.assertEqual(self.queued(1), [3, 4])
+
+        # A left swipe takes us out of their queue too.
+        next_candidates(3, 1, 10)
+        record_swipe(1, 3, 1, False)
+        self.assertEqual(self.queued(1), [4])
+        self.assertEqual(self.queued(3), [2, 4])
+        self.assertEqual(self.stack(), [4])
+
+    def test_queues_hold_the_best_candidates_and_are_topped_up(self):
+        with mock.patch("showup.queues.QUEUE_SIZE", 2):
+            self.assertEqual(self.stack(), [2, 3])
+            record_swipe(1, 2, 1, True)
+            record_swipe(1, 3, 1, False)
+            self.assertEqual(self.queued(1), [])
+            self.assertEqual(self.stack(), [4])
+            self.assertEqual(self.queued(1), [4])
+
+    def test_leaving_the_event_leaves_the_queues_alone(self):
+        next_candidates(2, 1, 10)
+        self.client.post(reverse("events"), {"not_interested": 1})
+        # We're still in their queue, but skipped.
+        self.assertIn(1, self.queued(2))
+        self.assertEqual([s.id for s in next_candidates(2, 1, 10)], [3, 4])
+
+        # Until we come back.
+        self.client.post(reverse("events"), {"interested": 1})
+        self.assertIn(1, [s.id for s in next_candidates(2, 1, 10)])
+        self.assertEqual(self.stack(), [2, 3, 4])
+
+    def test_joining_the_event_rebuilds_the_queues(self):
+        self.stack()
+        newcomer = CustomUser.objects.create_user(
+            username="jfallon@example.com",
+            email="jfallon@example.com",
+            password="heyhey123",
+            squad=Squad.objects.create(id=5),
+        )
+        client = Client()
+        client.force_login(newcomer)
+        client.post(reverse("home"), {"eid": 1, "going": ""})
+        # They're our size, so they go first.
+        self.assertEqual(self.stack(), [5, 2, 3, 4])
+        self.assertEqual(self.queued(1), [5, 2, 3, 4])
+
+    def test_merging_squads_rebuilds_their_queues(self):
+        next_candidates(2, 1, 10)
+        next_candidates(3, 1, 10)
+        merge_squads(self.squads[1], self.squads[2])
+        self.assertEqual(Concert.objects.get(id=1).queue_generation, 1)
+        self.assertEqual(self.stack(), [2, 4])
+
+
+class RecordSwipeTests(TestCase):
+    def setUp(self):
+        Concert.objects.create(id=1, datetime=datetime.datetime.now(tz=utc))
+        for i in range(1, 4):
+            Squad.objects.create(id=i)
+
+    def test_second_right_swipe_matches(self):
+        self.assertFalse(record_swipe(2, 1, 1, True))
+        self.assertFalse(Match.objects.exists())
+        self.assertTrue(record_swipe(1, 2, 1, True))
+        self.assertEqual(
+            list(Match.objects.values_list("squad_1", "squad_2", "event")), [(1, 2, 1)]
+        )
+
+    def test_left_swipes_dont_match(self):
+        record_swipe(2, 1, 1, False)
+        self.assertFalse(record_swipe(1, 2, 1, True))
+        record_swipe(3, 1, 1, True)
+        self.assertFalse(record_swipe(1, 3, 1, False))
+        self.assertFalse(Match.objects.exists())
+
+    def test_match_is_checked_and_saved_in_one_statement(self):
+        record_swipe(2, 1, 1, True)
+        with CaptureQueriesContext(connection) as queries:
+            record_swipe(1, 2, 1, True)
+        self.assertFalse(any(q["sql"].startswith("SELECT") for q in queries))
+
+    def test_swiping_twice_keeps_the_first_swipe(self):
+        record_swipe(2, 1, 1, True)
+        record_swipe(1, 2, 1, False)
+        self.assertFalse(record_swipe(1, 2, 1, True))
+        self.assertFalse(Match.objects.exists())
+
+        record_swipe(3, 1, 1, True)
+        self.assertTrue(record_swipe(1, 3, 1, True))
+        self.assertFalse(record_swipe(1, 3, 1, True))
+        self.assertEqual(Swipe.objects.filter(swiper=1).count(), 2)
+        self.assertEqual(Match.objects.count(), 1)
+
+    def test_existing_match_isnt_saved_twice(self):
+        Match.objects.create(squad_1_id=1, squad_2_id=2, event_id=1)
+        record_swipe(2, 1, 1, True)
+        self.assertFalse(record_swipe(1, 2, 1, True))
+        self.assertEqual(Match.objects.count(), 1)
+
+
+class SetAttendanceTests(TestCase):
+    def setUp(self):
+        Concert.objects.create(id=1, datetime=datetime.datetime.now(tz=utc))
+        self.squad = Squad.objects.create(id=1)
+        Squad.objects.create(id=2).interested.add(1)
+
+    def status(self):
+        return (
+            list(self.squad.interested.values_list("id", flat=True)),
+            list(self.squad.going.values_list("id", flat=True)),
+        )
+
+    def statements(self, status):
+        with CaptureQueriesContext(connection) as queries:
+            set_attendance(1, 1, status)
+        # Leaving out making the queues stale.
+        return [
+            q["sql"]
+            for q in queries
+            if "SAVEPOINT" not in q["sql"] and "queue_generation" not in q["sql"]
+        ]
+
+    def generation(self):
+        return Concert.objects.get(id=1).queue_generation
+
+    def test_switches_between_interested_going_and_neither(self):
+        set_attendance(1, 1, INTERESTED)
+        self.assertEqual(self.status(), ([1], []))
+        set_attendance(1, 1, GOING)
+        self.assertEqual(self.status(), ([], [1]))
+        set_attendance(1, 1, None)
+        self.assertEqual(self.status(), ([], []))
+
+    def test_setting_twice_changes_nothing(self):
+        for status, expected in ((GOING, ([], [1])), (None, ([], []))):
+            set_attendance(1, 1, status)
+            self.assertEqual(len(self.statements(status)), 2)
+            self.assertEqual(self.status(), expected)
+
+    def test_no_reads_and_queues_only_made_stale_on_join(self):
+        # Joining.
+        next_candidates(2, 1, 10)
+        statements = self.statements(INTERESTED)
+        self.assertEqual(len(statements), 2)
+        self.assertFalse(any(q.startswith("SELECT") for q in statements))
+        self.assertEqual(self.generation(), 1)
+
+        # Switching lists.
+        self.assertEqual(len(self.statements(GOING)), 2)
+        self.assertEqual(self.generation(), 1)
+
+        # Leaving doesn't touch the queues at all.
+        with CaptureQueriesContext(connection) as queries:
+            set_attendance(1, 1, None)
+        self.assertFalse(any("candidate" in q["sql"] for q in queries))
+        self.assertEqual(self.generation(), 1)
+
+
+class SwipesEndpointTests(TestCase):
+    def setUp(self):
+        event = Concert.objects.create(id=1, datetime=datetime.datetime.now(tz=utc))
+        for i in range(1, 6):
+            Squad.objects.create(id=i).interested.add(event)
+        user = CustomUser.objects.create_user(
+            username="jspringer@example.com",
+            email="jspringer@example.com",
+            first_name="Jerry",
+            squad=Squad.objects.get(id=1),
+        )
+        self.client.force_login(user)
+        self.url = reverse("swipes", args=(1,))
+
+    def swipe(self, *swipes):
+        return self.client.post(
+            self.url,
+            {"swipes": [{"squad": sid, "match": match} for sid, match in swipes]},
+            content_type="application/json",
+        )
+
+    def test_swipes_are_saved_in_one_batch(self):
+        Swipe.objects.create(swiper_id=2, swipee_id=1, event_id=1, direction=True)
+        Swipe.objects.create(swiper_id=3, swipee_id=1, event_id=1, direction=True)
+
+        response = self.swipe((2, True), (3, False), (4, True), (1, True))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["matches"], [2])
+        self.assertEqual([s["id"] for s in response.json()["next"]], [5])
+        self.assertEqual(
+            set(Swipe.objects.filter(swiper=1).values_list("swipee", "direction")),
+            {(2, True), (3, False), (4, True)},
+        )
+        self.assertEqual(
+            list(Match.objects.values_list("squad_1", "squad_2")), [(1, 2)]
+        )
+
+    def test_swiping_again_changes_nothing(self):
+        Swipe.objects.create(swiper_id=2, swipee_id=1, event_id=1, direction=True)
+        self.swipe((2, True))
+        response = self.swipe((2, False), (4, False))
+        self.assertEqual(response.json()["matches"], [])
+        self.assertTrue(Swipe.objects.get(swiper=1, swipee=2).direction)
+        self.assertEqual(Match.objects.count(), 1)
+
+    def test_next_squads_come_with_their_users(self):
+        CustomUser.objects.filter(first_name="Jerry").update(squad=2)
+        self.client.force_login(CustomUser.objects.get())
+        self.url = reverse("swipes", args=(1,))
+        response = self.swipe()
+        self.assertEqual(response.json()["next"][0]["id"], 1)
+
+    def test_swipes_on_squads_not_at_the_event_are_rejected(self):
+        Squad.objects.create(id=6)
+        for squad in (6, 999):
+            response = self.swipe((2, True), (squad, True))
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Swipe.objects.exists())
+
+    def test_malformed_swipes_are_rejected(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        self.assertEqual(
+            self.client.post(
+                self.url, "[", content_type="application/json"
+            ).status_code,
+            400,
+        )
+        self.assertEqual(self.swipe(("two", True)).status_code, 400)
+        self.assertEqual(self.swipe((2, "false")).status_code, 400)
+        self.assertEqual(self.swipe((2, 1)).status_code, 400)
+        self.assertEqual(self.swipe().status_code, 200)
+        self.assertEqual(
+            self.client.post(
+                reverse("swipes", args=(2,)),
+                {"swipes": []},
+                content_type="application/json",
+            ).status_code,
+            404,
+        )
@@ -6,6 +6,7 @@ urlpatterns = [
     path("accounts/", include("allauth.urls")),
     path("", views.home, name="home"),
     path("<int:eid>/match", views.event_stack, name="event_stack"),
+    path("<int:eid>/swipes", views.swipes, name="swipes"),
     path("u/<int:id>", views.user, name="user"),
     path("u/<int:id>/edit", views.edit_profile, name="edit_profile"),
     path("avatar/", include("avatar.urls")),
@@ -16,4 +17,5 @@ urlpatterns = [
     path("messages/<int:squad1>-<int:squad2>", views.messages, name="messages"),
     path("requests", views.requests, name="requests"),
     path("settings", views.settings, name="settings"),
+    path("profiling", views.profiling, name="profiling"),
 ]
@@ -1,12 +1,61 @@
+import json
+
 from .forms import CustomUserChangeForm, SquadForm, CustomUserForm
-from .models import Concert, CustomUser, Genre, Request, Squad, Swipe
+from .models import Concert, CustomUser, Match, Request, Squad
 from allauth.account.admin import EmailAddress
+from avatar.templatetags.avatar_tags import avatar_url
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    IntegerField,
+    OuterRef,
+    Prefetch,
+    Q,
+    When,
+    prefetch_related_objects,
+)
+from django.http import Http404, JsonResponse
 from django.shortcuts import redirect, render, reverse
-from .filters import ConcertFilter
-
-
+from django.utils import timezone
+from .facets import get_facets
+from .filters import ConcertFilter, encode_cursor
+from .profiling import stats as profiling_stats
+from .queues import next_candidates
+from .avatars import prime_avatars
+from .decorators import query_budget
+from .services import (
+    GOING,
+    INTERESTED,
+    merge_squads,
+    record_swipe,
+    record_swipes,
+    set_attendance,
+)
+
+# How many squads of the matching stack the page shows at a time.
+STACK_SIZE = 1
+
+# How many concerts the events page shows at a time.
+EVENTS_PAGE_SIZE = 48
+
+# The most swipes the swipes endpoint takes at once, and how many squads of
+# the stack it sends back.
+SWIPE_BATCH_SIZE = 100
+NEXT_SQUADS = 3
+
+# The buttons that move an event between my squad's lists, and where to.
+ATTENDANCE_BUTTONS = {
+    "interested": INTERESTED,
+    "going": GOING,
+    "not_interested": None,
+    "not_going": None,
+}
+
+
+@query_budget(12)
 def home(request):
     if request.user.is_authenticated:
         if request.method == "POST":
@@ -14,71 +63,93 @@ def home(request):
             squad = request.user.squad
 
             # Get the eid.
-            eid = request.POST.get("eid")
-
-            # Move event from "Going" to "Interested".
-            if "interested" in request.POST:
-                squad.going.remove(eid)
-                squad.interested.add(eid)
+            eid = int(request.POST.get("eid"))
 
-            # Move event from "Interested" to "Going".
-            if "going" in request.POST:
-                squad.interested.remove(eid)
-                squad.going.add(eid)
+            # Move the event between "Interested", "Going" and neither.
+            for button, status in ATTENDANCE_BUTTONS.items():
+                if button in request.POST:
+                    set_attendance(squad.id, eid, status)
 
-            # Remove event from "Interested".
-            if "not_interested" in request.POST:
-                squad.interested.remove(eid)
+    if not request.user.is_authenticated:
+        return render(request, "home.html")
 
-            # Remove event from "Going".
-            if "not_going" in request.POST:
-                squad.going.remove(eid)
+    # The events my squad is interested in and going to that aren't over, with
+    # their genres. That's one query for each list and one for the genres of
+    # both, and the counts are the lengths of the lists.
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    upcoming = Concert.objects.filter(datetime__gte=today).order_by("datetime", "id")
+    squad = request.user.squad
+    prefetch_related_objects(
+        [squad],
+        Prefetch("interested", queryset=upcoming, to_attr="upcoming_interested"),
+        Prefetch("going", queryset=upcoming, to_attr="upcoming_going"),
+    )
+    prefetch_related_objects(squad.upcoming_interested + squad.upcoming_going, "genres")
 
-    return render(request, "home.html")
+    return render(
+        request,
+        "home.html",
+        {"interested": squad.upcoming_interested, "going": squad.upcoming_going},
+    )
 
 
+@query_budget(16)
 @login_required
 def events(request):
     # My squad.
     squad = request.user.squad
 
-    filter = ConcertFilter(
-        request.GET, queryset=Concert.objects.all().order_by("datetime")
+    # User clicked "Interested" or "Going", or one of them again to undo it.
+    for button, status in ATTENDANCE_BUTTONS.items():
+        if button in request.POST:
+            set_attendance(squad.id, int(request.POST[button]), status)
+
+    # Whether my squad is interested in or going to each concert comes with
+    # the concert, so the cards don't look it up.
+    interested = Squad.interested.through.objects.filter(
+        squad=squad, concert=OuterRef("id")
     )
+    going = Squad.going.through.objects.filter(squad=squad, concert=OuterRef("id"))
+    concerts = Concert.objects.annotate(
+        is_interested=Exists(interested), is_going=Exists(going)
+    )
+
+    # The id breaks ties between concerts at the same time, so the order
+    # (and with it every cursor) is stable.
+    filter = ConcertFilter(request.GET, queryset=concerts.order_by("datetime", "id"))
+
+    # Fetch one extra concert to find out whether there's a next page.
+    page = list(filter.qs[: EVENTS_PAGE_SIZE + 1])
+    next_page = None
+    if len(page) > EVENTS_PAGE_SIZE:
+        page = page[:EVENTS_PAGE_SIZE]
+        query = request.GET.copy()
+        query["after"] = encode_cursor(page[-1])
+        next_page = query.urlencode()
+
+    # The first page keeps every filter but the cursor.
+    first_page = None
+    if "after" in request.GET:
+        query = request.GET.copy()
+        del query["after"]
+        first_page = query.urlencode()
+
+    facets = get_facets()
     context = {
         "filter": filter,
-        "interested_list": squad.interested.values_list("id", flat=True),
-        "going_list": squad.going.values_list("id", flat=True),
-        "unique_genres": [g.genre for g in Genre.objects.all()],
-        "unique_venues": set([c.venue_name for c in Concert.objects.all()]),
-        "unique_performers": set([c.performer_names for c in Concert.objects.all()]),
-        "boroughs": Concert.BOROUGH_CHOICES,
+        "page": page,
+        "next_page": next_page,
+        "first_page": first_page,
+        "unique_genres": facets["genres"],
+        "unique_venues": facets["venues"],
+        "unique_performers": facets["performers"],
+        "boroughs": facets["boroughs"],
     }
 
-    # User clicked "Interested" button.
-    if "interested" in request.POST:
-        insert_to_list_exclusively(
-            request.POST.get("interested"), squad.interested, squad.going
-        )
-
-    # User clicked "Going" button.
-    if "going" in request.POST:
-        insert_to_list_exclusively(
-            request.POST.get("going"), squad.going, squad.interested
-        )
-
     return render(request, "events.html", context=context)
 
 
-def insert_to_list_exclusively(event_id, add_list, remove_list):
-    if add_list.filter(id=event_id).count() > 0:
-        add_list.remove(event_id)
-    else:
-        add_list.add(event_id)
-        if remove_list.filter(id=event_id).count() > 0:
-            remove_list.remove(event_id)
-
-
+@query_budget(12)
 @login_required
 def user(request, id):
     # See if this user exists.
@@ -94,6 +165,7 @@ def user(request, id):
     return render(request, "user.html", context={"requested_user": user})
 
 
+@query_budget(5)
 @login_required
 def edit_profile(request, id):
     if request.user.id == id:
@@ -107,17 +179,20 @@ def edit_profile(request, id):
         raise PermissionDenied
 
 
+@query_budget(6)
 @login_required
 def squad(request, id):
     try:
         squad = Squad.objects.get(id=id)
-        users = CustomUser.objects.filter(squad=squad)
+        users = list(CustomUser.objects.filter(squad=squad))
     except Squad.DoesNotExist:
         raise PermissionDenied
+    prime_avatars(users)
 
     return render(request, "squad.html", context={"users": users})
 
 
+@query_budget(8)
 @login_required
 def edit_squad(request, sid):
     # You can only edit your own squad.
@@ -217,6 +292,7 @@ def edit_squad(request, sid):
         raise PermissionDenied
 
 
+@query_budget(38)
 @login_required
 def requests(request):
     if request.method == "POST":
@@ -225,46 +301,17 @@ def requests(request):
         their_squad = Squad.objects.get(id=request.POST["their_sid"])
 
         if "accept" in request.POST:
-            # Get the request.
-            r = Request.objects.get(requester=their_squad, requestee=my_squad)
+            # Make sure they asked to join.
+            Request.objects.get(requester=their_squad, requestee=my_squad)
 
             # Join the squad that has a smaller id.
             if their_squad.id < my_squad.id:
                 my_squad, their_squad = their_squad, my_squad
 
-            # Get their members.
-            their_members = CustomUser.objects.filter(squad=their_squad)
-
-            # Merge squads.
-            for member in their_members:
-                member.squad = my_squad
-                member.save()
-
-            # Add their interested events.
-            for event in their_squad.interested.all():
-                # If event is in interested then leave it in interested.
-                # If event is in going then leave it in going.
-                if (
-                    event not in my_squad.interested.all()
-                    and event not in my_squad.going.all()
-                ):
-                    my_squad.interested.add(event)
-
-            # Add their going events.
-            for event in their_squad.going.all():
-                # If event is in interested then put it in going.
-                if event in my_squad.interested.all():
-                    my_squad.interested.remove(event)
-                    my_squad.going.add(event)
-                # If event is not in going then put it in going.
-                if event not in my_squad.going.all():
-                    my_squad.going.add(event)
-
-            # Delete their old squad.
-            Squad.objects.get(id=their_squad.id).delete()
-
-            # Delete the request.
-            r.delete()
+            # Merge squads. The request goes with the squad that's deleted, in
+            # the same transaction.
+            merge_squads(my_squad, their_squad)
+            request.user.squad = my_squad
         elif "deny" in request.POST:
             # Get the request.
             r = Request.objects.filter(requester=their_squad, requestee=my_squad)
@@ -274,79 +321,39 @@ def requests(request):
         else:
             raise PermissionDenied
 
-    # Get all the squads that requested to join this squad.
-    squads = Request.objects.filter(requestee=request.user.squad)
-    squads = [x.requester for x in squads]
-
-    if squads:
-        # Get all the users of all the squads that requested to join this squad.
-        users = []
-        for squad in squads:
-            users += CustomUser.objects.filter(squad=squad)
-    else:
-        users = None
-
-    return render(request, "requests.html", {"squads": squads, "users": users})
-
-
-def get_stack(request, eid):
-    # My sid.
-    sid = request.user.squad.id
+        # Answering changed our pending requests after we loaded the squad,
+        # and the badge shows what's on it.
+        request.user.squad.refresh_from_db(fields=["pending_requests"])
 
-    # Get the squads interested in or going to the event.
-    squads = (
-        Squad.objects.filter(interested__id=eid) | Squad.objects.filter(going__id=eid)
-    ).distinct()
-
-    # These are the squads that swiped left on my squad.
-    swiped_left = [
-        x.swiper.id
-        for x in Swipe.objects.filter(swipee__id=sid, event__id=eid, direction=False)
-    ]
+    # Get all the squads that requested to join this squad, with their users.
+    requests = (
+        Request.objects.filter(requestee=request.user.squad)
+        .select_related("requester")
+        .prefetch_related("requester__squad")
+    )
+    squads = {r.requester: list(r.requester.squad.all()) for r in requests}
+    prime_avatars(u for users in squads.values() for u in users)
 
-    # These are the squads that my squad swiped on.
-    swiped = [x.swipee.id for x in Swipe.objects.filter(swiper__id=sid, event__id=eid)]
+    return render(request, "requests.html", {"squads": squads})
 
-    """
-    Exclude the following squads:
-    - The squads that swiped left on my squad.
-    - The squads that my squad swiped on.
-    - My squad.
-    """
-    squads = [
-        s
-        for s in squads
-        if s.id not in swiped_left and s.id not in swiped and s.id != sid
-    ]
 
-    return squads
+def get_stack(request, eid, limit=STACK_SIZE):
+    # The next squads in my squad's queue for the event, with their members.
+    return next_candidates(request.user.squad.id, eid, limit)
 
 
+@query_budget(25)
 @login_required
 def event_stack(request, eid):
     if request.method == "POST":
-        # Create a Swipe object.
+        # Create a Swipe object, and a Match if they swiped right on us too.
         my_sid = request.user.squad.id
-        their_sid = request.POST["their_sid"]
+        their_sid = int(request.POST["their_sid"])
         direction = True if request.POST["match"] == "True" else False
 
-        my_swipe = Swipe.objects.create(
-            swiper=Squad(id=my_sid),
-            swipee=Squad(id=their_sid),
-            event=Concert(id=eid),
-            direction=direction,
-        )
-
-        try:
-            # Check to see if their squad swiped on our squad.
-            their_swipe = Swipe.objects.get(
-                swiper__id=their_sid, swipee__id=my_sid, event__id=eid
-            )
-            if my_swipe.direction and their_swipe.direction:
-                match = Squad.objects.get(id=their_sid)
-            else:
-                match = None
-        except Swipe.DoesNotExist:
+        if record_swipe(my_sid, their_sid, eid, direction):
+            match = Squad(id=their_sid)
+        else:
             match = None
     else:
         match = None
@@ -354,56 +361,114 @@ def event_stack(request, eid):
     # Get event details.
     event = Concert.objects.get(id=eid)
 
-    # Get squads and users.
-    squads = get_stack(request, eid)
-    if squads:
-        # Get all the users of all the squads that are in the stack.
-        users = []
-        for squad in squads:
-            users += CustomUser.objects.filter(squad=squad)
-    else:
-        users = None
+    # Get the squads that are in the stack, with their users.
+    squads = {squad: list(squad.squad.all()) for squad in get_stack(request, eid)}
+    prime_avatars(u for users in squads.values() for u in users)
 
     return render(
-        request,
-        "match.html",
-        {"event": event, "squads": squads, "users": users, "match": match},
+        request, "match.html", {"event": event, "squads": squads, "match": match}
+    )
+
+
+@query_budget(23)
+@login_required
+def swipes(request, eid):
+    # Saves a batch of swipes, posted as JSON like
+    # {"swipes": [{"squad": 2, "match": true}, ...]}, and returns the squads
+    # we newly matched with and the next few squads of the stack.
+    if request.method != "POST":
+        return JsonResponse({"error": "Swipes have to be POSTed."}, status=405)
+    try:
+        batch = json.loads(request.body)["swipes"]
+        swiped = {int(s["squad"]): s["match"] for s in batch}
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Malformed swipes."}, status=400)
+    if not all(isinstance(match, bool) for match in swiped.values()):
+        return JsonResponse({"error": "Malformed swipes."}, status=400)
+    if len(swiped) > SWIPE_BATCH_SIZE:
+        return JsonResponse({"error": "Too many swipes."}, status=400)
+    if not Concert.objects.filter(id=eid).exists():
+        raise Http404
+
+    # Swiping on ourselves doesn't count, and the others have to be interested
+    # in or going to the event.
+    sid = request.user.squad.id
+    swiped.pop(sid, None)
+    if swiped:
+        interested = Squad.interested.through.objects.filter(concert=eid)
+        going = Squad.going.through.objects.filter(concert=eid)
+        attending = Squad.objects.filter(
+            Q(id__in=interested.values("squad")) | Q(id__in=going.values("squad")),
+            id__in=swiped,
+        )
+        if attending.count() != len(swiped):
+            return JsonResponse({"error": "Unknown squads."}, status=400)
+    matched = record_swipes(sid, eid, list(swiped.items()))
+
+    squads = get_stack(request, eid, NEXT_SQUADS)
+    prime_avatars(u for squad in squads for u in squad.squad.all())
+    return JsonResponse(
+        {
+            "matches": matched,
+            "next": [
+                {
+                    "id": squad.id,
+                    "users": [
+                        {
+                            "id": u.id,
+                            "first_name": u.first_name,
+                            "avatar": avatar_url(u),
+                        }
+                        for u in squad.squad.all()
+                    ],
+                }
+                for squad in squads
+            ],
+        }
     )
 
 
+@query_budget(6)
 @login_required
 def matches(request):
     # My sid.
     sid = request.user.squad.id
 
-    # The squads that my squad swiped right on.
-    i_swiped_right = [x for x in Swipe.objects.filter(swiper__id=sid, direction=True)]
+    # My matches, each with the id of the squad on the other side.
+    matches = (
+        Match.objects.filter(Q(squad_1=sid) | Q(squad_2=sid))
+        .annotate(
+            other_id=Case(
+                When(squad_1=sid, then=F("squad_2")),
+                default=F("squad_1"),
+                output_field=IntegerField(),
+            )
+        )
+        .select_related("event")
+        .order_by("event_id", "other_id")
+    )
 
-    # The squads that swiped right on my squad.
-    they_swiped_right = [
-        x.swiper for x in Swipe.objects.filter(swipee__id=sid, direction=True)
-    ]
+    # The users of every squad I matched with.
+    matches = list(matches)
+    users = list(
+        CustomUser.objects.filter(squad__in={m.other_id for m in matches}).order_by(
+            "squad", "id"
+        )
+    )
+    prime_avatars(users)
+    members = {}
+    for u in users:
+        members.setdefault(u.squad_id, []).append(u)
 
-    # The intersection of the above two.
-    uniq_events = set()
-    uniq_sid = set()
-    users = []
-    matches = [x for x in i_swiped_right if x.swipee in they_swiped_right]
-    matches.sort(key=lambda x: x.event.id)
+    # Each event with its matches, and each match with the other squad's users.
+    events = {}
     for match in matches:
-        uniq_events.add(match.event)
-        uniq_sid.add(match.swipee)
-
-    for id in uniq_sid:
-        users += CustomUser.objects.filter(squad=id)
+        events.setdefault(match.event, []).append((match, members.get(match.other_id)))
 
-    return render(
-        request,
-        "matches.html",
-        {"matches": matches, "events": uniq_events, "users": users},
-    )
+    return render(request, "matches.html", {"matches": matches, "events": events})
 
 
+@query_budget(3)
 @login_required
 def settings(request):
     msg = ""
@@ -415,26 +480,24 @@ def settings(request):
     return render(request, "settings.html", {"user": request.user, "message": msg})
 
 
+@query_budget(2)
 @login_required
-def messages(request, squad1, squad2):
-    # My sid.
-    sid = request.user.squad.id
-
-    # The squads that my squad swiped right on.
-    i_swiped_right = [x for x in Swipe.objects.filter(swiper__id=sid, direction=True)]
-
-    # The squads that swiped right on my squad.
-    they_swiped_right = [
-        x.swiper for x in Swipe.objects.filter(swipee__id=sid, direction=True)
-    ]
+def profiling(request):
+    # What ProfilingMiddleware has collected in this process, for staff only.
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return JsonResponse(profiling_stats.snapshot())
 
-    # The intersection of the above two.
-    matches = [x.swipee.id for x in i_swiped_right if x.swipee in they_swiped_right]
 
+@query_budget(4)
+@login_required
+def messages(request, squad1, squad2):
     if request.user.squad.id != squad1:
         # If you do not belong to squad1, you do not have permission to view.
         raise PermissionDenied
-    elif squad2 not in matches:
+    elif not Match.objects.filter(
+        squad_1=min(squad1, squad2), squad_2=max(squad1, squad2)
+    ).exists():
         # If squad1 did not match with squad2, they cannot chat.
         raise PermissionDenied
     else: